@@ -1,7 +1,74 @@
 from coupons.models import Coupon
-from decimal import Decimal
-from django.conf import settings
-from shop.models import Product 
+from functools import cached_property
+from shop.cards import get_product_cards
+from shop.money import from_cents, percent_of, to_cents
+from .forms import CartAddProductForm
+from .storage import get_storage
+
+
+class CartLine:
+    """
+    Immutable line of the cart, built once per request.
+    Amounts are kept in cents.
+    """
+    __slots__ = ['product', 'quantity', 'price_cents', 'total_cents']
+
+    def __init__(self, product, quantity, price_cents):
+        object.__setattr__(self, 'product', product)
+        object.__setattr__(self, 'quantity', quantity)
+        object.__setattr__(self, 'price_cents', price_cents)
+        object.__setattr__(self, 'total_cents', price_cents * quantity)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('CartLine is immutable')
+
+    @property
+    def price(self):
+        return from_cents(self.price_cents)
+
+    @property
+    def total_price(self):
+        return from_cents(self.total_cents)
+
+    @property
+    def product_id(self):
+        return self.product.id
+
+    @property
+    def update_quantity_form(self):
+        return CartAddProductForm(
+            initial={'quantity': self.quantity, 'override': True}
+        )
+
+
+class CartSummary:
+    """
+    Totals of the cart in cents, computed once per request.
+    """
+    __slots__ = ['count', 'subtotal_cents', 'coupon', 'discount_cents',
+                 'total_cents']
+
+    def __init__(self, count, subtotal_cents, coupon):
+        self.count = count
+        self.subtotal_cents = subtotal_cents
+        self.coupon = coupon
+        self.discount_cents = 0
+        if coupon:
+            self.discount_cents = percent_of(subtotal_cents, coupon.discount)
+        self.total_cents = subtotal_cents - self.discount_cents
+
+    @property
+    def subtotal(self):
+        return from_cents(self.subtotal_cents)
+
+    @property
+    def discount(self):
+        return from_cents(self.discount_cents)
+
+    @property
+    def total(self):
+        return from_cents(self.total_cents)
+
 
 class Cart:
     def __init__(self, request):
@@ -9,11 +76,9 @@ class Cart:
         Initialize the cart.
         """
         self.session = request.session
-        cart = self.session.get(settings.CART_SESSION_ID)
-        if not cart:
-            # save an empty cart in the session.
-            cart = self.session[settings.CART_SESSION_ID] = {}
-        self.cart = cart
+        self.storage = get_storage(request)
+        # set when the cart changes during the request.
+        self.modified = False
         # store current applied coupon
         self.coupon_id = self.session.get('coupon_id')
     
@@ -21,65 +86,91 @@ class Cart:
         """
         Add a product to the cart or update its quantity.
         """
-        product_id = str(product.id)
-        if product_id not in self.cart:
-            self.cart[product_id] = {
-                'quantity': 0,
-                'price': str(product.price)
-            }
-        if override_quantity:
-            self.cart[product_id]['quantity'] = quantity
-        else:
-            self.cart[product_id]['quantity'] += quantity 
-        self.save()
+        self.storage.add(
+            str(product.id),
+            to_cents(product.price),
+            quantity,
+            override_quantity
+        )
+        self.changed()
+
+    @property
+    def cart(self):
+        # items are only loaded from the storage when needed.
+        return self.storage.items
 
     def save(self):
-        # mark the session as 'modified' to make sure it gets saved.
-        self.session.modified = True
+        self.storage.save()
+
+    def changed(self):
+        self.modified = True
+        # drop lines and totals computed before the cart changed.
+        self.__dict__.pop('lines', None)
+        self.__dict__.pop('summary', None)
+
+    def update_price(self, product, price):
+        """
+        Store the current price of a product in the cart, keeping its
+        quantity.
+        """
+        quantity = self.cart[str(product.id)]['quantity']
+        self.storage.remove(str(product.id))
+        self.storage.add(str(product.id), to_cents(price), quantity)
+        self.changed()
 
     def remove(self, product):
         """
         Remove a product from the cart.
         """
-        product_id = str(product.id)
-        if product_id in self.cart:
-            del self.cart[product_id]
-            self.save()
+        self.storage.remove(str(product.id))
+        self.changed()
+
+    @cached_property
+    def lines(self):
+        """
+        Cart lines with their product cards, fetched once per request.
+        """
+        cards = {
+            card.id: card
+            for card in get_product_cards(int(id) for id in self.cart)
+        }
+        return [
+            CartLine(cards[int(id)], item['quantity'], item['price'])
+            for id, item in self.cart.items()
+            if int(id) in cards
+        ]
 
     def __iter__(self):
         """
-        Iterate over the items in the cart and get the products form the database.
+        Iterate over the lines of the cart.
         """        
-        product_ids = self.cart.keys()
-        # get the product objects and add them to the cart.
-        products = Product.objects.filter(id__in=product_ids)
-        cart = self.cart.copy()
-        for product in products:
-            cart[str(product.id)]['product'] = product
-        for item in cart.values():
-            item['price'] = Decimal(item['price'])   
-            item['total_price'] = item['price'] * item['quantity']
-            yield item
+        return iter(self.lines)
+
+    @cached_property
+    def summary(self):
+        return CartSummary(
+            len(self), self.storage.subtotal_cents, self.coupon
+        )
 
     def __len__(self):
         """
-        Count all items in the cart.
+        Count all items in the cart, kept up to date by the storage
+        so neither the items nor the products are loaded.
         """
-        return sum(item['quality'] for item in self.cart.values())
+        return self.storage.count
 
     def get_total_price(self):
-        return sum(
-            Decimal(item['price']) * item['quantity'] for item in self.cart.values()
-        )
+        return from_cents(self.storage.subtotal_cents)
     
     def clear(self):
-        # Remove the cart from the session.
-        del self.session[settings.CART_SESSION_ID]
-        self.save()
+        # Remove the cart from its storage.
+        self.storage.clear()
+        self.changed()
 
 
-    @property
+    @cached_property
     def coupon(self):
+        # looked up at most once per request.
         if self.coupon_id:
             try:
                 return Coupon.objects.get(id=self.coupon_id)
@@ -88,17 +179,17 @@ class Cart:
             return None
 
     def get_discount(self):        
-        if self.coupon:
-            return (
-                self.coupon.discount / Decimal(100)
-            ) * self.get_total_price()
-        return Decimal(0)
+        return self.summary.discount
     
     def get_total_price_after_discount(self):
-        return self.get_total_price() - self.get_discount() 
-
-
-
-
+        return self.summary.total
 
 
+def get_cart(request):
+    """
+    Return the cart of the request, shared by the views and
+    templates rendered during the request.
+    """
+    if not hasattr(request, '_cart'):
+        request._cart = Cart(request)
+    return request._cart
@@ -1,6 +1,8 @@
 # Context Processors can reside anywhere in the code ,but having seperate file for them make the code more organized.
 
-from . cart import Cart
+from django.utils.functional import SimpleLazyObject
+from . cart import get_cart
 
 def cart(request):
-    return {'cart': Cart(request)}
\ No newline at end of file
+    # the cart is only loaded if the template uses it.
+    return {'cart': SimpleLazyObject(lambda: get_cart(request))}
\ No newline at end of file
@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core import signing
+
+BADGE_SALT = 'cart.badge'
+
+
+class CartBadgeMiddleware:
+    """
+    Keep a signed cookie with the cart item count and subtotal up to date,
+    so cached pages can render the cart badge without reading the session.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        cart = getattr(request, '_cart', None)
+        if cart is not None and cart.modified:
+            if len(cart):
+                response.set_signed_cookie(
+                    settings.CART_BADGE_COOKIE,
+                    f'{len(cart)}:{cart.get_total_price()}',
+                    salt=BADGE_SALT,
+                    max_age=settings.CART_TTL,
+                    samesite='Lax'
+                )
+            else:
+                response.delete_cookie(settings.CART_BADGE_COOKIE)
+        return response
+
+
+def get_cart_badge(request):
+    """
+    Return the (count, subtotal) pair stored in the badge cookie,
+    or None if it is missing or was tampered with.
+    """
+    try:
+        value = request.get_signed_cookie(
+            settings.CART_BADGE_COOKIE, salt=BADGE_SALT
+        )
+    except (KeyError, signing.BadSignature):
+        return None
+    count, subtotal = value.split(':')
+    return int(count), subtotal
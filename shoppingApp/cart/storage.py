@@ -0,0 +1,265 @@
+import functools
+import uuid
+
+import redis
+from django.conf import settings
+from django.utils.module_loading import import_string
+from shop.money import to_cents
+
+
+class SessionStorage:
+    """
+    Cart stored as a dict in the session, with the item count and
+    subtotal kept up to date under CART_SUMMARY_SESSION_ID.
+    Prices are stored in cents.
+    """
+
+    def __init__(self, request):
+        self.session = request.session
+        cart = self.session.get(settings.CART_SESSION_ID)
+        if not isinstance(cart, dict):
+            # save an empty cart in the session.
+            cart = self.session[settings.CART_SESSION_ID] = {}
+        for item in cart.values():
+            if isinstance(item['price'], str):
+                # carts saved with decimal string prices.
+                item['price'] = to_cents(item['price'])
+        self.items = cart
+        summary = self.session.get(settings.CART_SUMMARY_SESSION_ID)
+        if summary is None:
+            # carts saved before the summary was stored.
+            summary = self.session[settings.CART_SUMMARY_SESSION_ID] = {
+                'count': sum(item['quantity'] for item in cart.values()),
+                'subtotal': sum(
+                    item['price'] * item['quantity'] for item in cart.values()
+                ),
+            }
+        self.summary = summary
+
+    @property
+    def count(self):
+        return self.summary['count']
+
+    @property
+    def subtotal_cents(self):
+        return self.summary['subtotal']
+
+    def _update_summary(self, item, quantity):
+        delta = quantity - item['quantity']
+        self.summary['count'] += delta
+        self.summary['subtotal'] += delta * item['price']
+
+    def add(self, product_id, price, quantity, override_quantity=False):
+        """
+        Add quantity units of a product priced in cents, or set its
+        quantity if override_quantity is True. Returns the new quantity.
+        """
+        if product_id not in self.items:
+            self.items[product_id] = {'quantity': 0, 'price': price}
+        item = self.items[product_id]
+        if not override_quantity:
+            quantity += item['quantity']
+        self._update_summary(item, quantity)
+        item['quantity'] = quantity
+        self.save()
+        return quantity
+
+    def remove(self, product_id):
+        if product_id in self.items:
+            self._update_summary(self.items[product_id], 0)
+            del self.items[product_id]
+            self.save()
+
+    def clear(self):
+        # Remove the cart from the session.
+        del self.session[settings.CART_SESSION_ID]
+        del self.session[settings.CART_SUMMARY_SESSION_ID]
+        self.items = {}
+        self.summary = {'count': 0, 'subtotal': 0}
+        self.save()
+
+    def save(self):
+        # mark the session as 'modified' to make sure it gets saved.
+        self.session.modified = True
+
+
+@functools.cache
+def get_redis():
+    return redis.Redis(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        db=settings.REDIS_DB
+    )
+
+
+# Add to or set the quantity of a product and update the item count and
+# subtotal fields. KEYS[1] is the cart hash, ARGV[1] the product id,
+# ARGV[2] its price in cents, ARGV[3] the quantity, ARGV[4] whether to
+# override the quantity and ARGV[5] the cart TTL.
+ADD_SCRIPT = """
+local quantity_field = 'quantity:' .. ARGV[1]
+local price_field = 'price:' .. ARGV[1]
+redis.call('HSETNX', KEYS[1], price_field, ARGV[2])
+local price = tonumber(redis.call('HGET', KEYS[1], price_field))
+local old = tonumber(redis.call('HGET', KEYS[1], quantity_field) or '0')
+local new = tonumber(ARGV[3])
+if ARGV[4] ~= '1' then
+    new = old + new
+end
+redis.call('HSET', KEYS[1], quantity_field, new)
+redis.call('HINCRBY', KEYS[1], 'count', new - old)
+redis.call('HINCRBY', KEYS[1], 'subtotal', (new - old) * price)
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+return new
+"""
+
+# Remove a product and update the item count and subtotal fields.
+# KEYS[1] is the cart hash, ARGV[1] the product id and ARGV[2] the cart
+# TTL. A product not in the cart, or an expired cart, is left untouched
+# so the hash is not recreated without a TTL.
+REMOVE_SCRIPT = """
+local quantity_field = 'quantity:' .. ARGV[1]
+local price_field = 'price:' .. ARGV[1]
+local quantity = redis.call('HGET', KEYS[1], quantity_field)
+if not quantity then
+    return 0
+end
+quantity = tonumber(quantity)
+local price = tonumber(redis.call('HGET', KEYS[1], price_field) or '0')
+redis.call('HDEL', KEYS[1], quantity_field, price_field)
+redis.call('HINCRBY', KEYS[1], 'count', -quantity)
+redis.call('HINCRBY', KEYS[1], 'subtotal', -quantity * price)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return quantity
+"""
+
+
+class RedisStorage:
+    """
+    Cart stored as a Redis hash with a quantity and a price field per
+    product plus item count and subtotal fields, so adding and removing
+    products are atomic single round trip updates and the cart badge
+    is read without loading the items. The session only holds the cart id.
+    """
+
+    def __init__(self, request):
+        self.session = request.session
+        self.r = get_redis()
+        self.cart_id = self.session.get(settings.CART_SESSION_ID)
+        if isinstance(self.cart_id, dict):
+            # cart saved by SessionStorage, move it to a hash.
+            self.cart_id = self.import_cart(self.cart_id)
+        elif not isinstance(self.cart_id, str):
+            # no cart yet, the id is created on the first add.
+            self.cart_id = None
+        self.add_script = self.r.register_script(ADD_SCRIPT)
+        self.remove_script = self.r.register_script(REMOVE_SCRIPT)
+
+    def import_cart(self, cart):
+        """
+        Store the items of a session cart in a new cart hash, replacing
+        the session cart with its id. Returns the id, or None for an
+        empty cart.
+        """
+        self.session.pop(settings.CART_SUMMARY_SESSION_ID, None)
+        if not cart:
+            del self.session[settings.CART_SESSION_ID]
+            return None
+        cart_id = uuid.uuid4().hex
+        fields = {'count': 0, 'subtotal': 0}
+        for product_id, item in cart.items():
+            price = item['price']
+            if isinstance(price, str):
+                # carts saved with decimal string prices.
+                price = to_cents(price)
+            fields[f'quantity:{product_id}'] = item['quantity']
+            fields[f'price:{product_id}'] = price
+            fields['count'] += item['quantity']
+            fields['subtotal'] += item['quantity'] * price
+        key = f'cart:{cart_id}'
+        with self.r.pipeline() as pipe:
+            pipe.hset(key, mapping=fields)
+            pipe.expire(key, settings.CART_TTL)
+            pipe.execute()
+        self.session[settings.CART_SESSION_ID] = cart_id
+        return cart_id
+
+    def get_key(self):
+        return f'cart:{self.cart_id}'
+
+    @functools.cached_property
+    def items(self):
+        if not self.cart_id:
+            return {}
+        items = {}
+        for field, value in self.r.hgetall(self.get_key()).items():
+            name, _, product_id = field.decode().partition(':')
+            if not product_id:
+                # count and subtotal fields.
+                continue
+            item = items.setdefault(product_id, {'quantity': 0, 'price': 0})
+            item[name] = int(value)
+        return items
+
+    @functools.cached_property
+    def _summary(self):
+        if not self.cart_id:
+            return [0, 0]
+        count, subtotal = self.r.hmget(self.get_key(), 'count', 'subtotal')
+        return [int(count or 0), int(subtotal or 0)]
+
+    @property
+    def count(self):
+        return self._summary[0]
+
+    @property
+    def subtotal_cents(self):
+        return self._summary[1]
+
+    def add(self, product_id, price, quantity, override_quantity=False):
+        """
+        Add quantity units of a product priced in cents, or set its
+        quantity if override_quantity is True. Returns the new quantity.
+        """
+        if not self.cart_id:
+            self.cart_id = uuid.uuid4().hex
+            self.session[settings.CART_SESSION_ID] = self.cart_id
+        quantity = self.add_script(
+            keys=[self.get_key()],
+            args=[
+                product_id, price, quantity,
+                int(override_quantity), settings.CART_TTL
+            ]
+        )
+        self.changed()
+        return quantity
+
+    def remove(self, product_id):
+        if self.cart_id:
+            self.remove_script(
+                keys=[self.get_key()], args=[product_id, settings.CART_TTL]
+            )
+            self.changed()
+
+    def clear(self):
+        if self.cart_id:
+            self.r.delete(self.get_key())
+            del self.session[settings.CART_SESSION_ID]
+            self.cart_id = None
+        self.changed()
+
+    def changed(self):
+        # reload items and totals on next access.
+        self.__dict__.pop('items', None)
+        self.__dict__.pop('_summary', None)
+
+    def save(self):
+        # fields are written as they change, nothing left to save.
+        pass
+
+
+def get_storage(request):
+    """
+    Return the cart storage configured in CART_STORAGE for the request.
+    """
+    return import_string(settings.CART_STORAGE)(request)
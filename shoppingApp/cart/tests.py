@@ -1,3 +1,179 @@
-from django.test import TestCase
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+from django.contrib.sessions.backends.signed_cookies import SessionStore
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from .cart import get_cart
+from .middleware import CartBadgeMiddleware, get_cart_badge
+from .storage import RedisStorage, SessionStorage
 
-# Create your tests here.
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+def make_request():
+    request = RequestFactory().get('/')
+    request.session = SessionStore()
+    return request
+
+
+class StorageTests:
+    """
+    Tests shared by the cart storages, run by subclasses setting storage.
+    """
+    storage = None
+
+    def setUp(self):
+        self.request = make_request()
+
+    def get_storage(self):
+        return self.storage(self.request)
+
+    def test_add_keeps_count_and_subtotal(self):
+        storage = self.get_storage()
+        self.assertEqual(storage.add('1', 250, 2), 2)
+        self.assertEqual(storage.add('1', 250, 1), 3)
+        self.assertEqual(storage.add('2', 100, 4), 4)
+        storage = self.get_storage()
+        self.assertEqual(storage.count, 7)
+        self.assertEqual(storage.subtotal_cents, 1150)
+        self.assertEqual(storage.items['1'], {'quantity': 3, 'price': 250})
+
+    def test_override_quantity(self):
+        storage = self.get_storage()
+        storage.add('1', 250, 5)
+        self.assertEqual(storage.add('1', 250, 2, override_quantity=True), 2)
+        self.assertEqual(storage.count, 2)
+        self.assertEqual(storage.subtotal_cents, 500)
+
+    def test_remove(self):
+        storage = self.get_storage()
+        storage.add('1', 250, 2)
+        storage.add('2', 100, 1)
+        storage.remove('1')
+        storage.remove('3')
+        storage = self.get_storage()
+        self.assertEqual(list(storage.items), ['2'])
+        self.assertEqual(storage.count, 1)
+        self.assertEqual(storage.subtotal_cents, 100)
+
+    def test_clear(self):
+        storage = self.get_storage()
+        storage.add('1', 250, 2)
+        storage.clear()
+        storage = self.get_storage()
+        self.assertEqual(storage.items, {})
+        self.assertEqual(storage.count, 0)
+        self.assertEqual(storage.subtotal_cents, 0)
+
+
+class SessionStorageTests(StorageTests, SimpleTestCase):
+    storage = SessionStorage
+
+    def test_decimal_string_prices(self):
+        self.request.session['cart'] = {
+            '1': {'quantity': 2, 'price': '2.50'},
+        }
+        storage = self.get_storage()
+        self.assertEqual(storage.items['1']['price'], 250)
+        self.assertEqual(storage.count, 2)
+        self.assertEqual(storage.subtotal_cents, 500)
+
+
+@skipUnless(fakeredis, 'fakeredis is not installed')
+@override_settings(CART_TTL=60)
+class RedisStorageTests(StorageTests, SimpleTestCase):
+    storage = RedisStorage
+
+    def setUp(self):
+        super().setUp()
+        self.redis = fakeredis.FakeRedis()
+        patcher = mock.patch(
+            'cart.storage.get_redis', return_value=self.redis
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_session_cart_is_imported(self):
+        self.request.session['cart'] = {
+            '1': {'quantity': 2, 'price': 250},
+            '2': {'quantity': 1, 'price': '1.00'},
+        }
+        self.request.session['cart_summary'] = {'count': 3, 'subtotal': 600}
+        storage = self.get_storage()
+        self.assertIsInstance(self.request.session['cart'], str)
+        self.assertNotIn('cart_summary', self.request.session)
+        self.assertEqual(self.redis.ttl(storage.get_key()), 60)
+        storage = self.get_storage()
+        self.assertEqual(storage.items, {
+            '1': {'quantity': 2, 'price': 250},
+            '2': {'quantity': 1, 'price': 100},
+        })
+        self.assertEqual(storage.count, 3)
+        self.assertEqual(storage.subtotal_cents, 600)
+        self.assertEqual(storage.add('1', 250, 1), 3)
+
+    def test_empty_session_cart(self):
+        self.request.session['cart'] = {}
+        storage = self.get_storage()
+        self.assertIsNone(storage.cart_id)
+        self.assertNotIn('cart', self.request.session)
+        self.assertEqual(storage.count, 0)
+
+    def test_remove_refreshes_ttl(self):
+        storage = self.get_storage()
+        storage.add('1', 250, 2)
+        storage.add('2', 100, 1)
+        self.redis.expire(storage.get_key(), 5)
+        storage.remove('1')
+        self.assertEqual(self.redis.ttl(storage.get_key()), 60)
+
+    def test_remove_from_expired_cart(self):
+        storage = self.get_storage()
+        storage.add('1', 250, 2)
+        self.redis.delete(storage.get_key())
+        storage.remove('1')
+        # the expired cart is not recreated without a TTL.
+        self.assertFalse(self.redis.exists(storage.get_key()))
+        self.assertEqual(storage.count, 0)
+
+
+@override_settings(CART_STORAGE='cart.storage.SessionStorage')
+class CartBadgeMiddlewareTests(SimpleTestCase):
+
+    def get_response(self, request, add=0, remove=False):
+        def view(request):
+            cart = get_cart(request)
+            product = SimpleNamespace(id=1, price=Decimal('2.50'))
+            if add:
+                cart.add(product, add)
+            if remove:
+                cart.remove(product)
+            return HttpResponse()
+        return CartBadgeMiddleware(view)(request)
+
+    def test_badge_cookie_follows_cart(self):
+        request = make_request()
+        response = self.get_response(request, add=3)
+        cookie = response.cookies['cart_badge']
+        session = request.session
+        request = make_request()
+        request.session = session
+        request.COOKIES['cart_badge'] = cookie.value
+        self.assertEqual(get_cart_badge(request), (3, '7.50'))
+
+        response = self.get_response(request, remove=True)
+        # an empty cart deletes the cookie.
+        self.assertEqual(response.cookies['cart_badge'].value, '')
+
+    def test_unchanged_cart_keeps_cookie(self):
+        response = self.get_response(make_request())
+        self.assertNotIn('cart_badge', response.cookies)
+
+    def test_tampered_cookie(self):
+        request = make_request()
+        request.COOKIES['cart_badge'] = '3:7.50'
+        self.assertIsNone(get_cart_badge(request))
@@ -3,14 +3,14 @@ from coupons.forms import CouponApplyForm
 from django.shortcuts import render, get_object_or_404, redirect
 from django.views.decorators.http import require_POST
 from shop.models import Product
-from .cart import Cart
+from .cart import get_cart
 from .forms import CartAddProductForm
 
 # Create your views here.
 
 @require_POST 
 def cart_add(request, product_id):
-    cart = Cart(request)
+    cart = get_cart(request)
     product = get_object_or_404(Product, id=product_id)
     form = CartAddProductForm(request.POST)
     if form.is_valid():
@@ -24,7 +24,7 @@ def cart_add(request, product_id):
 
 @require_POST
 def cart_remove(request, product_id):
-    cart = Cart(request)
+    cart = get_cart(request)
     product = get_object_or_404(Product, id=product_id)
     cart.remove(product)
     return redirect('cart:cart_detail') 
@@ -32,15 +32,11 @@ def cart_remove(request, product_id):
 # This view is for displaying the cart and its items.
 
 def cart_detail(request):
-    cart = Cart(request)
-    for item in cart:
-        item['update_quantity_form'] = CartAddProductForm(
-            initial={'quantity': item['quantity'], 'override':True}
-        )
+    cart = get_cart(request)
     coupon_apply_form = CouponApplyForm()
 
     r = Recommender()
-    cart_products = [item['product'] for item in cart]
+    cart_products = [item.product for item in cart]
     if (cart_products):
         recommended_products = r.suggest_products_for(
             cart_products, max_results=4
@@ -1,5 +1,6 @@
 import os 
 from celery import Celery
+from celery.signals import worker_process_init
 
 # set the default Django settings module for the 'celery' program.
 
@@ -8,3 +9,63 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myshop.settings')
 app = Celery('myshop')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
+
+
+@app.on_after_finalize.connect
+def setup_periodic_tasks(sender, **kwargs):
+    from django.conf import settings
+    from orders.tasks import delete_exports, send_outbox
+    from payment.tasks import requeue_stripe_events
+    from shop.tasks import (
+        purge_recommendations, refresh_recommendations, trim_recommendations
+    )
+
+    # rebuild precomputed product suggestions.
+    sender.add_periodic_task(
+        settings.RECOMMENDER_REFRESH_INTERVAL,
+        refresh_recommendations.s(),
+        name='refresh recommendations'
+    )
+    # trim co-purchase sets and bestseller lists back to their cap.
+    if (
+        settings.RECOMMENDER_MAX_PARTNERS
+        or settings.RECOMMENDER_MAX_BESTSELLERS
+    ):
+        sender.add_periodic_task(
+            settings.RECOMMENDER_TRIM_INTERVAL,
+            trim_recommendations.s(),
+            name='trim recommendations'
+        )
+    if settings.RECOMMENDER_DECAY_HALF_LIFE:
+        # rebase decayed scores and drop partners that decayed away.
+        sender.add_periodic_task(
+            settings.RECOMMENDER_DECAY_INTERVAL,
+            purge_recommendations.s(),
+            name='purge recommendations'
+        )
+    # retry outbox e-mails that failed or were never drained.
+    sender.add_periodic_task(
+        settings.MAIL_OUTBOX_INTERVAL,
+        send_outbox.s(),
+        name='send outbox'
+    )
+    # delete expired order exports.
+    sender.add_periodic_task(
+        60 * 60,
+        delete_exports.s(),
+        name='delete exports'
+    )
+    # process webhook events whose task failed or was never queued.
+    sender.add_periodic_task(
+        settings.STRIPE_EVENT_RETRY_AFTER,
+        requeue_stripe_events.s(),
+        name='requeue stripe events'
+    )
+
+
+@worker_process_init.connect
+def warm_pdf_renderer(**kwargs):
+    from orders.pdf import get_renderer
+
+    # parse invoice stylesheets before the first task needs them.
+    get_renderer().warm()
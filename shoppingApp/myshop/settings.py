@@ -24,12 +24,59 @@ STRIPE_PUBLISHABLE_KEY = config('STRIPE_PUBLISHABLE_KEY', default='')
 STRIPE_SECRET_KEY = config('STRIPE_SECRET_KEY', default='')
 STRIPE_API_VERSION = '2024-04-10'
 STRIPE_WEBHOOK_SECRET = config('STRIPE_WEBHOOK_SECRET', default='')
+# seconds before unprocessed webhook events are queued again.
+STRIPE_EVENT_RETRY_AFTER = 60 * 10
+# module used for Stripe API calls, payment.stripe_stub works offline.
+STRIPE_MODULE = config('STRIPE_MODULE', default='stripe')
 
 # Redis settings
 REDIS_HOST = 'localhost'
 REDIS_PORT = 6379
 REDIS_DB = 1
 
+# Product recommendations
+# storage for co-purchase scores, shop.backends.MemoryBackend keeps them in-process.
+RECOMMENDER_BACKEND = config('RECOMMENDER_BACKEND', default='shop.backends.RedisBackend')
+# co-purchase partners kept per product (0 disables trimming).
+RECOMMENDER_MAX_PARTNERS = config('RECOMMENDER_MAX_PARTNERS', default=50, cast=int)
+# products kept per bestseller list (0 disables trimming).
+RECOMMENDER_MAX_BESTSELLERS = config('RECOMMENDER_MAX_BESTSELLERS', default=100, cast=int)
+# ingestion lets lists grow to this multiple of their cap so new products
+# can build up a score, the trim_recommendations task trims back to the cap.
+RECOMMENDER_TRIM_HEADROOM = 4
+# seconds between runs of the trim_recommendations task.
+RECOMMENDER_TRIM_INTERVAL = 60 * 60
+# suggestions precomputed per product by the refresh_recommendations task.
+RECOMMENDER_PRECOMPUTED_RESULTS = 6
+# seconds between runs of the refresh_recommendations task.
+RECOMMENDER_REFRESH_INTERVAL = config('RECOMMENDER_REFRESH_INTERVAL', default=60, cast=int)
+# seconds multi-product suggestion unions are cached for.
+RECOMMENDER_UNION_TTL = 60
+# half-life in days of co-purchase scores (0 disables time decay).
+RECOMMENDER_DECAY_HALF_LIFE = config('RECOMMENDER_DECAY_HALF_LIFE', default=0, cast=float)
+# initial unix timestamp decayed increments are scaled from (2024-01-01
+# UTC), the purge task moves the stored epoch forward.
+RECOMMENDER_DECAY_EPOCH = 1704067200
+# seconds between runs of the purge task that also rebases scores.
+RECOMMENDER_DECAY_INTERVAL = 60 * 60 * 24
+# half-lives past the epoch after which the purge task rebases scores.
+RECOMMENDER_DECAY_REBASE = 16
+# decayed score below which partners are purged.
+RECOMMENDER_DECAY_THRESHOLD = 0.1
+
+# ==========================
+# Cache
+# ==========================
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': config('CACHE_URL', default=f'redis://{REDIS_HOST}:{REDIS_PORT}/0'),
+    }
+}
+
+# seconds product cards used by listings are cached for.
+PRODUCT_CARD_CACHE_TIMEOUT = 60 * 60
+
 # ==========================
 # Security
 # ==========================
@@ -46,10 +93,40 @@ MEDIA_ROOT = BASE_DIR / 'media'
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'static'
 
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+    # order exports, private and served through the admin only.
+    'exports': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {'location': BASE_DIR / 'exports'},
+    },
+}
+
 # ==========================
 # Cart
 # ==========================
 CART_SESSION_ID = 'cart'
+# item count and subtotal of carts stored in the session.
+CART_SUMMARY_SESSION_ID = 'cart_summary'
+# cart.storage.SessionStorage keeps the whole cart in the session instead.
+CART_STORAGE = config('CART_STORAGE', default='cart.storage.RedisStorage')
+# seconds a cart stored in Redis lives after its last change.
+CART_TTL = config('CART_TTL', default=60 * 60 * 24 * 7, cast=int)
+# signed cookie with the cart item count and subtotal for cached pages.
+CART_BADGE_COOKIE = 'cart_badge'
+
+# ==========================
+# Orders
+# ==========================
+# seconds background order exports and their progress are kept.
+ORDER_EXPORT_TTL = 60 * 60 * 24
+# invoices rendered by each task of a bulk invoice export.
+INVOICE_RENDER_BATCH_SIZE = config('INVOICE_RENDER_BATCH_SIZE', default=20, cast=int)
 
 # ==========================
 # Applications
@@ -83,6 +160,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'cart.middleware.CartBadgeMiddleware',
 ]
 
 ROOT_URLCONF = 'myshop.urls'
@@ -123,6 +201,16 @@ DATABASES = {
 # Email
 # ==========================
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+# messages sent per outbox drain over one mail connection.
+MAIL_OUTBOX_BATCH_SIZE = 100
+# attempts before an outbox message is given up on.
+MAIL_OUTBOX_MAX_ATTEMPTS = 5
+# seconds between periodic drains that retry failed messages.
+MAIL_OUTBOX_INTERVAL = 60
+# seconds new messages wait so that one drain sends them together.
+MAIL_OUTBOX_DEBOUNCE = 5
+# seconds after which messages claimed by a crashed drain are sent again.
+MAIL_OUTBOX_CLAIM_TIMEOUT = 300
 
 # ==========================
 # Password Validation
@@ -162,6 +250,26 @@ PARLER_LANGUAGES = {
     }
 }
 
+# ==========================
+# Logging
+# ==========================
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        # PDF setup and render times.
+        'orders.pdf': {
+            'handlers': ['console'],
+            'level': config('PDF_LOG_LEVEL', default='INFO'),
+        },
+    },
+}
+
 # ==========================
 # Default Primary Key Field Type
 # ==========================
@@ -1,42 +1,75 @@
-from django.urls import reverse
-import csv
-import datetime
-from django.http import HttpResponse
+import uuid
+from django.urls import path, reverse
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from django.utils.translation import get_language
+from django.shortcuts import render
 from django.utils.safestring import mark_safe
-from django.contrib import admin
-from .models import Order, OrderItem
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from .exports import (
+    EXPORT_FORMATS, get_export_fields, get_export_filters,
+    get_export_status, get_export_storage, set_export_status
+)
+from .models import Order, OrderItem, OutboxMessage
+from . import tasks
 
 def order_detail(obj):
     url = reverse('orders:admin_order_detail', args=[obj.id])
     return mark_safe(f'<a href="{url}">View</a>')
 
-def export_to_csv(modeladmin, request, queryset):
+def export(modeladmin, queryset, format):
     opts = modeladmin.model._meta
-    content_disposition = f'attachment; filename={opts.verbose_name}.csv'
-    response = HttpResponse(content_type='text/csv')
+    content_type, iter_rows = EXPORT_FORMATS[format]
+    content_disposition = (
+        f'attachment; filename={opts.verbose_name}.{format}'
+    )
+    response = StreamingHttpResponse(
+        iter_rows(queryset, get_export_fields(opts)),
+        content_type=content_type
+    )
     response['Content-Disposition'] = content_disposition
-    writer = csv.writer(response)
-
-    fields = [
-        field for field in opts.get_fields()
-        if not field.many_to_many and not field.one_to_many
-    ]
-
-    # Write header row
-    writer.writerow([field.verbose_name for field in fields])
-
-    # Write data rows
-    for obj in queryset:
-        data_row = []
-        for field in fields:
-            value = getattr(obj, field.name)
-            if isinstance(value, datetime.datetime):
-                value = value.strftime('%d/%m/%y')
-            data_row.append(value)
-        writer.writerow(data_row)
     return response
+
+def export_to_csv(modeladmin, request, queryset):
+    return export(modeladmin, queryset, 'csv')
 export_to_csv.short_description = 'Export to CSV'
 
+def export_to_ndjson(modeladmin, request, queryset):
+    return export(modeladmin, queryset, 'ndjson')
+export_to_ndjson.short_description = 'Export to NDJSON'
+
+def start_export(modeladmin, request, task, *args):
+    export_id = uuid.uuid4().hex
+    set_export_status(export_id, state='PENDING', rows=0, total=None)
+    if request.POST.get('select_across') == '1':
+        # every order matching the changelist filters.
+        task.delay(
+            export_id, *args,
+            filters=get_export_filters(modeladmin, request.GET)
+        )
+    else:
+        # the orders ticked on the current page.
+        task.delay(
+            export_id, *args, ids=[
+                int(id) for id in request.POST.getlist(ACTION_CHECKBOX_NAME)
+            ]
+        )
+    url = reverse('admin:orders_order_export', args=[export_id])
+    modeladmin.message_user(
+        request,
+        mark_safe(f'Export started. <a href="{url}">Follow its progress</a>.'),
+        messages.INFO
+    )
+
+def export_in_background(modeladmin, request, queryset):
+    start_export(modeladmin, request, tasks.export_orders)
+export_in_background.short_description = 'Export to CSV in background'
+
+def export_invoices(modeladmin, request, queryset):
+    # invoices are rendered by workers, in the language of the request.
+    start_export(modeladmin, request, tasks.export_invoices, get_language())
+export_invoices.short_description = 'Export invoices (ZIP) in background'
+
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
@@ -59,6 +92,7 @@ class OrderAdmin(admin.ModelAdmin):
         'postal_code',
         'city',
         'paid',
+        'total',
         'order_payment',
         'created',
         'updated',
@@ -67,7 +101,12 @@ class OrderAdmin(admin.ModelAdmin):
     ]
     list_filter = ['paid', 'created', 'updated']
     inlines = [OrderItemInline]
-    actions = [export_to_csv]
+    actions = [
+        export_to_csv,
+        export_to_ndjson,
+        export_in_background,
+        export_invoices,
+    ]
 
     def order_payment(self, obj):
         url = obj.get_stripe_url()
@@ -76,3 +115,65 @@ class OrderAdmin(admin.ModelAdmin):
             return mark_safe(html)
         return ''
     order_payment.short_description = 'Stripe payment'
+
+    def get_urls(self):
+        return [
+            path(
+                'export/<str:export_id>/',
+                self.admin_site.admin_view(self.export_status),
+                name='orders_order_export'
+            ),
+            path(
+                'export/<str:export_id>/download/',
+                self.admin_site.admin_view(self.export_download),
+                name='orders_order_export_download'
+            ),
+        ] + super().get_urls()
+
+    def export_status(self, request, export_id):
+        status = get_export_status(export_id)
+        if status is None:
+            raise Http404('Unknown or expired export.')
+        url = None
+        if status['state'] == 'SUCCESS':
+            url = reverse(
+                'admin:orders_order_export_download', args=[export_id]
+            )
+        return render(request, 'admin/orders/order/export.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'status': status,
+            'download_url': url,
+        })
+
+    def export_download(self, request, export_id):
+        if not self.has_view_permission(request):
+            raise Http404('Unknown or expired export.')
+        status = get_export_status(export_id)
+        storage = get_export_storage()
+        if (
+            status is None
+            or status['state'] != 'SUCCESS'
+            or not storage.exists(status['name'])
+        ):
+            raise Http404('Unknown or expired export.')
+        return FileResponse(
+            storage.open(status['name']),
+            as_attachment=True,
+            filename=status['name'].rsplit('/', 1)[-1]
+        )
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # the discount may have changed without touching any item.
+        form.instance.update_totals()
+
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ['id', 'subject', 'created', 'sent', 'attempts']
+    list_filter = ['sent', 'created']
+    readonly_fields = [
+        'created', 'sent', 'attempts', 'last_error', 'claim', 'claimed'
+    ]
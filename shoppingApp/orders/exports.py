@@ -0,0 +1,176 @@
+import csv
+import datetime
+import gzip
+import io
+import json
+import tempfile
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.storage import storages
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """
+    File-like object that returns what is written instead of buffering it.
+    """
+    def write(self, value):
+        return value
+
+
+def get_export_fields(opts):
+    return [
+        field for field in opts.get_fields()
+        if field.concrete and not field.many_to_many
+    ]
+
+
+def iter_export_rows(queryset, fields, chunk_size=EXPORT_CHUNK_SIZE,
+                     progress=None):
+    """
+    Yield value tuples of the given fields, foreign keys as raw ids.
+    The optional progress callable receives the row count per chunk.
+    """
+    # values_list() skips model instances and related lookups entirely.
+    rows = queryset.values_list(
+        *[field.attname for field in fields]
+    ).iterator(chunk_size=chunk_size)
+    count = 0
+    for count, row in enumerate(rows, 1):
+        yield row
+        if progress and count % chunk_size == 0:
+            progress(count)
+    if progress:
+        progress(count)
+
+
+def iter_csv(queryset, fields, chunk_size=EXPORT_CHUNK_SIZE, progress=None):
+    writer = csv.writer(Echo())
+    # Write header row
+    yield writer.writerow([field.verbose_name for field in fields])
+    # Write data rows
+    for row in iter_export_rows(queryset, fields, chunk_size, progress):
+        yield writer.writerow([
+            value.strftime('%d/%m/%y')
+            if isinstance(value, datetime.datetime) else value
+            for value in row
+        ])
+
+
+def iter_ndjson(queryset, fields, chunk_size=EXPORT_CHUNK_SIZE,
+                progress=None):
+    names = [field.attname for field in fields]
+    for row in iter_export_rows(queryset, fields, chunk_size, progress):
+        yield json.dumps(dict(zip(names, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', iter_csv),
+    'ndjson': ('application/x-ndjson', iter_ndjson),
+}
+
+
+def get_export_filters(modeladmin, params):
+    """
+    Keep the changelist parameters that filter on a list_filter field,
+    as plain lookups a task can apply to a fresh queryset.
+    """
+    fields = {name for name in modeladmin.list_filter if isinstance(name, str)}
+    return {
+        lookup: value for lookup, value in params.items()
+        if lookup.split('__')[0] in fields
+    }
+
+
+def filter_export(queryset, ids=None, filters=None):
+    """
+    Narrow the queryset to the given ids and changelist filter lookups.
+    """
+    if ids is not None:
+        queryset = queryset.filter(id__in=ids)
+    if filters:
+        queryset = queryset.filter(**filters)
+    return queryset
+
+
+def get_export_storage():
+    # private storage, files are only served by the staff download view.
+    return storages['exports']
+
+
+def get_export_status(export_id):
+    key = f'orders:export:{export_id}'
+    values = cache.get_many([key, f'{key}:rows'])
+    status = values.get(key)
+    if status is not None and f'{key}:rows' in values:
+        # rows counted by tasks running in parallel.
+        status['rows'] = values[f'{key}:rows']
+    return status
+
+
+def set_export_status(export_id, **status):
+    cache.set(
+        f'orders:export:{export_id}', status, settings.ORDER_EXPORT_TTL
+    )
+
+
+def start_export_rows(export_id, rows=0):
+    cache.set(
+        f'orders:export:{export_id}:rows', rows, settings.ORDER_EXPORT_TTL
+    )
+
+
+def add_export_rows(export_id, rows):
+    """
+    Count rows done by one of several parallel tasks and return the number
+    of rows done so far.
+    """
+    return cache.incr(f'orders:export:{export_id}:rows', rows)
+
+
+def write_export(queryset, name, format, chunk_size=EXPORT_CHUNK_SIZE,
+                 progress=None):
+    """
+    Write a gzip compressed export of the queryset to the export
+    storage and return the stored file name.
+    """
+    _, iter_rows = EXPORT_FORMATS[format]
+    fields = get_export_fields(queryset.model._meta)
+    with tempfile.TemporaryFile() as tmp:
+        with gzip.GzipFile(fileobj=tmp, mode='wb') as gz:
+            out = io.TextIOWrapper(gz, encoding='utf-8', newline='')
+            for line in iter_rows(queryset, fields, chunk_size, progress):
+                out.write(line)
+            out.flush()
+            # leave closing to the gzip file, which keeps tmp open.
+            out.detach()
+        tmp.seek(0)
+        return get_export_storage().save(f'{name}.{format}.gz', File(tmp))
+
+
+def delete_expired_exports():
+    """
+    Delete stored exports older than ORDER_EXPORT_TTL.
+    Returns the number of files deleted.
+    """
+    storage = get_export_storage()
+    expired = timezone.now() - datetime.timedelta(
+        seconds=settings.ORDER_EXPORT_TTL
+    )
+    count = 0
+    try:
+        directories, _ = storage.listdir('')
+    except FileNotFoundError:
+        return 0
+    # one directory per export id.
+    for directory in directories:
+        for name in storage.listdir(directory)[1]:
+            name = f'{directory}/{name}'
+            if storage.get_modified_time(name) < expired:
+                storage.delete(name)
+                count += 1
+    return count
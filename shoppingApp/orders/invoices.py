@@ -0,0 +1,181 @@
+import hashlib
+import json
+import tempfile
+import zipfile
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import FileResponse, HttpResponseNotModified
+from django.template.loader import render_to_string
+from django.utils.translation import get_language
+from .exports import get_export_storage
+from .models import Order
+from .pdf import get_renderer
+
+# bump when the invoice template or stylesheet changes.
+INVOICE_VERSION = 1
+
+
+def invoice_orders():
+    """
+    Orders with everything the invoice template reads prefetched.
+    """
+    return Order.objects.select_related('coupon').prefetch_related(
+        'items__product__translations'
+    )
+
+
+def get_invoice_digest(order):
+    """
+    Hash of everything rendered on the invoice of the order.
+    """
+    content = [
+        INVOICE_VERSION,
+        get_language(),
+        order.id,
+        order.created,
+        order.first_name,
+        order.last_name,
+        order.email,
+        order.address,
+        order.postal_code,
+        order.city,
+        order.paid,
+        order.coupon.code if order.coupon else None,
+        order.discount,
+        order.subtotal,
+        order.discount_amount,
+        order.total,
+        [
+            (item.product.name, item.price, item.quantity)
+            for item in order.items.all()
+        ],
+    ]
+    return hashlib.sha256(
+        json.dumps(content, cls=DjangoJSONEncoder).encode()
+    ).hexdigest()
+
+
+def render_invoice(order):
+    html = render_to_string('orders/order/pdf.html', {'order': order})
+    return get_renderer().render(html)
+
+
+def get_invoice(order):
+    """
+    Return the storage name and digest of the invoice of the order,
+    rendering and storing it only if its content changed.
+    """
+    digest = get_invoice_digest(order)
+    name = get_invoice_name(order.id, digest)
+    if not default_storage.exists(name):
+        stale = get_invoice_names(order.id, f'{get_language()}-')
+        name = default_storage.save(name, ContentFile(render_invoice(order)))
+        for stale_name in stale:
+            default_storage.delete(stale_name)
+    return name, digest
+
+
+def get_missing_invoices(queryset, chunk_size=500):
+    """
+    Return the ids of the given orders whose current invoice is not stored.
+    """
+    missing = []
+    # stored invoices are found by hashing, which needs no rendering.
+    for order in invoice_orders().filter(
+        id__in=queryset.values('id')
+    ).iterator(chunk_size=chunk_size):
+        name = get_invoice_name(order.id, get_invoice_digest(order))
+        if not default_storage.exists(name):
+            missing.append(order.id)
+    return missing
+
+
+def get_invoice_name(order_id, digest):
+    return f'invoices/{order_id}/{get_language()}-{digest}.pdf'
+
+
+def get_invoice_names(order_id, prefix=''):
+    try:
+        _, files = default_storage.listdir(f'invoices/{order_id}')
+    except FileNotFoundError:
+        return []
+    return [
+        f'invoices/{order_id}/{name}'
+        for name in files if name.startswith(prefix)
+    ]
+
+
+def delete_invoices(order_id):
+    for name in get_invoice_names(order_id):
+        default_storage.delete(name)
+
+
+def invoice_response(request, order):
+    """
+    Serve the stored invoice of the order, honouring If-None-Match.
+    """
+    name, digest = get_invoice(order)
+    etag = f'"{digest}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(
+            default_storage.open(name), content_type='application/pdf'
+        )
+        response['Content-Disposition'] = f'filename=order_{order.id}.pdf'
+    response['ETag'] = etag
+    return response
+
+
+class ZipStream:
+    """
+    Unseekable file collecting what the zip writer produces.
+    """
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_invoice_zip(queryset, chunk_size=100):
+    """
+    Yield a ZIP archive of the invoices of the given orders one file at a
+    time, rendering any invoice that is not stored yet.
+    """
+    stream = ZipStream()
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_STORED) as archive:
+        for order in invoice_orders().filter(
+            id__in=queryset.values('id')
+        ).order_by('id').iterator(chunk_size=chunk_size):
+            name, _ = get_invoice(order)
+            with default_storage.open(name) as invoice, archive.open(
+                f'order_{order.id}.pdf', 'w'
+            ) as entry:
+                for chunk in invoice.chunks():
+                    entry.write(chunk)
+            yield stream.pop()
+    yield stream.pop()
+
+
+def write_invoice_zip(queryset, name):
+    """
+    Write a ZIP archive of the invoices of the given orders to the export
+    storage and return the stored file name.
+    """
+    with tempfile.TemporaryFile() as tmp:
+        for data in iter_invoice_zip(queryset):
+            tmp.write(data)
+        tmp.seek(0)
+        return get_export_storage().save(f'{name}.zip', File(tmp))
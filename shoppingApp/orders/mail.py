@@ -0,0 +1,129 @@
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import OutboxAttachment, OutboxMessage
+
+OUTBOX_DRAIN_KEY = 'orders:outbox:drain'
+
+
+def enqueue_mail(subject, body, from_email, to, attachments=()):
+    """
+    Store an e-mail in the outbox and schedule a drain once the current
+    transaction commits. Attachments are (filename, content, mimetype).
+    """
+    with transaction.atomic():
+        message = OutboxMessage.objects.create(
+            subject=subject, body=body, from_email=from_email, to=list(to)
+        )
+        OutboxAttachment.objects.bulk_create([
+            OutboxAttachment(
+                message=message,
+                filename=filename,
+                content=content,
+                mimetype=mimetype
+            )
+            for filename, content, mimetype in attachments
+        ])
+        transaction.on_commit(schedule_drain)
+    return message
+
+
+def schedule_drain():
+    """
+    Schedule a delayed drain unless one is already pending, so messages
+    enqueued close together are sent by the same drain.
+    """
+    from .tasks import send_outbox
+
+    debounce = settings.MAIL_OUTBOX_DEBOUNCE
+    # cache.add() is atomic, only the first caller in a window schedules.
+    if cache.add(OUTBOX_DRAIN_KEY, 1, debounce * 2):
+        send_outbox.apply_async(countdown=debounce)
+
+
+def build_email(message, connection):
+    email = EmailMessage(
+        message.subject,
+        message.body,
+        message.from_email,
+        message.to,
+        connection=connection
+    )
+    for attachment in message.attachments.all():
+        email.attach(
+            attachment.filename,
+            bytes(attachment.content),
+            attachment.mimetype
+        )
+    return email
+
+
+def claim_messages(batch_size, max_attempts):
+    """
+    Claim up to batch_size pending messages for this drain and return them.
+    """
+    now = timezone.now()
+    pending = OutboxMessage.objects.filter(
+        Q(claimed__isnull=True)
+        | Q(claimed__lt=now - timedelta(
+            seconds=settings.MAIL_OUTBOX_CLAIM_TIMEOUT
+        )),
+        sent__isnull=True,
+        attempts__lt=max_attempts,
+    )
+    ids = list(
+        pending.order_by('id').values_list('id', flat=True)[:batch_size]
+    )
+    if not ids:
+        return []
+    claim = uuid.uuid4().hex
+    # the conditional update lets only one drain claim each message,
+    # whatever the database's support for row locks.
+    pending.filter(id__in=ids).update(claim=claim, claimed=now)
+    return list(
+        OutboxMessage.objects.filter(claim=claim).order_by('id')
+        .prefetch_related('attachments')
+    )
+
+
+def drain_outbox(batch_size=None, max_attempts=None):
+    """
+    Send one batch of pending outbox messages over a single mail
+    connection. Messages that fail are kept for a later drain until
+    they run out of attempts. Return the number of messages claimed
+    and the number sent.
+    """
+    batch_size = batch_size or settings.MAIL_OUTBOX_BATCH_SIZE
+    max_attempts = max_attempts or settings.MAIL_OUTBOX_MAX_ATTEMPTS
+    messages = claim_messages(batch_size, max_attempts)
+    if not messages:
+        return 0, 0
+    sent = 0
+    try:
+        with get_connection() as connection:
+            for message in messages:
+                message.attempts += 1
+                try:
+                    connection.send_messages(
+                        [build_email(message, connection)]
+                    )
+                except Exception as e:
+                    message.last_error = repr(e)
+                else:
+                    message.sent = timezone.now()
+                    message.last_error = ''
+                    sent += 1
+    finally:
+        # release the claims, unsent messages are picked up again.
+        for message in messages:
+            message.claim = ''
+            message.claimed = None
+        OutboxMessage.objects.bulk_update(
+            messages, ['attempts', 'sent', 'last_error', 'claim', 'claimed']
+        )
+    return len(messages), sent
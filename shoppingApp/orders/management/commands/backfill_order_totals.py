@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django.db import models
+from django.db.models import F, Sum
+from orders.models import Order
+from shop.money import to_cents
+
+
+class Command(BaseCommand):
+    help = 'Compute the stored subtotal, discount and total of orders.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Orders read and updated per batch.'
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Recompute every order, not only those with a zero total.'
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        orders = Order.objects.all()
+        if not options['all']:
+            orders = orders.filter(total=0)
+        # sum all items in the same query as the orders.
+        orders = orders.annotate(
+            items_total=Sum(
+                F('items__price') * F('items__quantity'),
+                output_field=models.DecimalField()
+            )
+        ).only('id', 'discount').order_by('id')
+        fields = ['subtotal', 'discount_amount', 'total']
+        batch = []
+        count = 0
+        for order in orders.iterator(chunk_size=chunk_size):
+            order.set_totals(to_cents(order.items_total or 0))
+            batch.append(order)
+            if len(batch) >= chunk_size:
+                Order.objects.bulk_update(batch, fields)
+                count += len(batch)
+                batch = []
+        if batch:
+            Order.objects.bulk_update(batch, fields)
+            count += len(batch)
+        self.stdout.write(self.style.SUCCESS(
+            f'Backfilled totals of {count} orders.'
+        ))
@@ -1,8 +1,9 @@
-from decimal import Decimal
 from django.core.validators import MaxValueValidator, MinValueValidator
 from coupons.models import Coupon 
 from django.db import models
+from django.db.models import F, Sum
 from django.conf import settings
+from shop.money import from_cents, percent_of, to_cents
 from django.utils.translation import gettext_lazy as _
 
 class Order(models.Model):
@@ -32,6 +33,16 @@ class Order(models.Model):
         validators=[MinValueValidator(0), MaxValueValidator(100)]
 
     )
+    # denormalized totals, kept in sync by set_totals()/update_totals().
+    subtotal = models.DecimalField(
+        max_digits=10, decimal_places=2, default=0
+    )
+    discount_amount = models.DecimalField(
+        max_digits=10, decimal_places=2, default=0
+    )
+    total = models.DecimalField(
+        max_digits=10, decimal_places=2, default=0
+    )
 
 
 
@@ -45,8 +56,7 @@ class Order(models.Model):
         return f'Order {self.id}'
 
     def get_total_cost(self):
-        total_cost = self.get_total_cost_before_discount()
-        return total_cost - self.get_discount()
+        return self.total
        
     def get_stripe_url(self):
         if not self.stripe_id:
@@ -62,13 +72,41 @@ class Order(models.Model):
 
 
     def get_total_cost_before_discount(self):
-        return sum(item.get_cost() for item in self.items.all())
+        return self.subtotal
     
     def get_discount(self):
-        total_cost = self.get_total_cost_before_discount()
-        if self.discount:
-            return total_cost * (self.discount / Decimal(100))
-        return Decimal(0)
+        return self.discount_amount
+
+    def set_totals(self, subtotal_cents):
+        """
+        Set subtotal, discount amount and total from a subtotal in cents.
+        """
+        discount_cents = percent_of(subtotal_cents, self.discount)
+        self.subtotal = from_cents(subtotal_cents)
+        self.discount_amount = from_cents(discount_cents)
+        self.total = from_cents(subtotal_cents - discount_cents)
+
+    def compute_subtotal_cents(self):
+        # summed by the database, converted to cents once.
+        total = self.items.aggregate(
+            total=Sum(
+                F('price') * F('quantity'),
+                output_field=models.DecimalField()
+            )
+        )['total']
+        return to_cents(total or 0)
+
+    def update_totals(self, save=True):
+        """
+        Recompute the stored totals from the order items.
+        """
+        self.set_totals(self.compute_subtotal_cents())
+        if save:
+            Order.objects.filter(id=self.id).update(
+                subtotal=self.subtotal,
+                discount_amount=self.discount_amount,
+                total=self.total,
+            )
 
          
 
@@ -93,6 +131,45 @@ class OrderItem(models.Model):
     
     def get_cost(self):
         return self.price * self.quantity 
+
+    def get_cost_cents(self):
+        return to_cents(self.price) * self.quantity
     
 
 
+
+
+class OutboxMessage(models.Model):
+    """
+    E-mail waiting to be sent by the send_outbox task.
+    """
+    subject = models.CharField(max_length=250)
+    body = models.TextField()
+    from_email = models.CharField(max_length=250)
+    to = models.JSONField(default=list)
+    created = models.DateTimeField(auto_now_add=True)
+    sent = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # set by the drain sending the message, see drain_outbox().
+    claim = models.CharField(max_length=32, blank=True)
+    claimed = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['sent', 'id']),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} to {", ".join(self.to)}'
+
+
+class OutboxAttachment(models.Model):
+    message = models.ForeignKey(
+        OutboxMessage,
+        related_name='attachments',
+        on_delete=models.CASCADE
+    )
+    filename = models.CharField(max_length=250)
+    content = models.BinaryField()
+    mimetype = models.CharField(max_length=100)
@@ -0,0 +1,94 @@
+import functools
+import logging
+import time
+from django.contrib.staticfiles import finders
+from django.utils.functional import cached_property
+
+logger = logging.getLogger(__name__)
+
+
+class PDFRenderer:
+    """
+    Renders HTML to PDF with WeasyPrint, reusing the font configuration
+    and parsed stylesheets across renders in the same process.
+    """
+    def __init__(self, stylesheets=('css/pdf.css',)):
+        self.stylesheet_paths = stylesheets
+        self.renders = 0
+        self.render_time = 0.0
+        self.last_render_time = None
+        self.setup_time = None
+
+    @cached_property
+    def weasyprint(self):
+        # imported on first use, processes that never render skip it.
+        import weasyprint
+        return weasyprint
+
+    @cached_property
+    def font_config(self):
+        from weasyprint.text.fonts import FontConfiguration
+        return FontConfiguration()
+
+    @cached_property
+    def stylesheets(self):
+        start = time.perf_counter()
+        stylesheets = [
+            self.weasyprint.CSS(
+                filename=finders.find(path), font_config=self.font_config
+            )
+            for path in self.stylesheet_paths
+        ]
+        self.setup_time = time.perf_counter() - start
+        logger.info(
+            'Parsed %d PDF stylesheets in %.3fs.',
+            len(stylesheets), self.setup_time
+        )
+        return stylesheets
+
+    def warm(self):
+        """
+        Import WeasyPrint and parse the stylesheets ahead of the first render.
+        """
+        return self.stylesheets
+
+    def render(self, html):
+        """
+        Return the PDF rendered from the given HTML as bytes.
+        """
+        stylesheets = self.stylesheets
+        start = time.perf_counter()
+        pdf = self.weasyprint.HTML(string=html).write_pdf(
+            stylesheets=stylesheets, font_config=self.font_config
+        )
+        self.last_render_time = time.perf_counter() - start
+        self.render_time += self.last_render_time
+        self.renders += 1
+        logger.info(
+            'Rendered PDF in %.3fs, %d renders averaging %.3fs.',
+            self.last_render_time, self.renders,
+            self.render_time / self.renders
+        )
+        return pdf
+
+    def get_stats(self):
+        """
+        Return render counts and timings of this process.
+        """
+        return {
+            'renders': self.renders,
+            'render_time': self.render_time,
+            'average_render_time': (
+                self.render_time / self.renders if self.renders else None
+            ),
+            'last_render_time': self.last_render_time,
+            'setup_time': self.setup_time,
+        }
+
+
+@functools.cache
+def get_renderer():
+    """
+    Return the PDF renderer of this process.
+    """
+    return PDFRenderer()
@@ -0,0 +1,23 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .invoices import delete_invoices
+from .models import Order, OrderItem
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def order_item_changed(sender, instance, **kwargs):
+    # the order may already be gone when items are deleted by cascade.
+    order = Order.objects.filter(
+        id=instance.order_id
+    ).only('id', 'discount').first()
+    if order:
+        order.update_totals()
+        delete_invoices(order.id)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def order_changed(sender, instance, **kwargs):
+    # stored invoices are re-rendered on their next request.
+    delete_invoices(instance.id)
@@ -1,6 +1,18 @@
-from celery import shared_task
-from django.core.mail import send_mail
+import smtplib
+from celery import group, shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import override
+from .exports import (
+    add_export_rows, delete_expired_exports, filter_export,
+    set_export_status, start_export_rows, write_export, EXPORT_CHUNK_SIZE
+)
+from .invoices import (
+    get_invoice, get_missing_invoices, invoice_orders, write_invoice_zip
+)
+from .mail import OUTBOX_DRAIN_KEY, drain_outbox, enqueue_mail
 from .models import Order
+from .pdf import get_renderer
 
 
 @shared_task 
@@ -16,7 +28,125 @@ def order_created(order_id):
         f'You have successfully placed an order.'
         f'Your order ID is {order.id}.'
     )
-    mail_sent = send_mail(
-        subject, message ,'admin@myshop.com', [order.email]
+    enqueue_mail(subject, message, 'admin@myshop.com', [order.email])
+
+
+@shared_task
+def export_orders(export_id, ids=None, filters=None, format='csv',
+                  chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Task to write a compressed export of orders to the export storage,
+    keeping its progress in the cache. Orders are selected by id or by
+    changelist filter lookups.
+    """
+    queryset = filter_export(Order.objects.all(), ids, filters)
+    total = queryset.count()
+
+    def progress(rows):
+        set_export_status(
+            export_id, state='PROGRESS', rows=rows, total=total
+        )
+
+    progress(0)
+    try:
+        name = write_export(
+            queryset, f'{export_id}/orders', format,
+            chunk_size, progress
+        )
+    except Exception:
+        set_export_status(export_id, state='FAILURE', rows=0, total=total)
+        raise
+    set_export_status(
+        export_id, state='SUCCESS', rows=total, total=total, name=name
     )
-    return mail_sent
\ No newline at end of file
+    return name
+
+
+@shared_task
+def export_invoices(export_id, language, ids=None, filters=None):
+    """
+    Task to render the missing invoices of orders in a group of parallel
+    tasks, the last of which stores the invoices in a ZIP archive.
+    """
+    queryset = filter_export(Order.objects.all(), ids, filters)
+    total = queryset.count()
+    with override(language):
+        missing = get_missing_invoices(queryset)
+    set_export_status(export_id, state='PROGRESS', rows=0, total=total)
+    start_export_rows(export_id, total - len(missing))
+    if not missing:
+        zip_invoices.delay(export_id, language, total, ids, filters)
+        return 0
+    batch_size = settings.INVOICE_RENDER_BATCH_SIZE
+    group(
+        render_invoices.s(
+            export_id, language, missing[i:i + batch_size], total,
+            ids, filters
+        )
+        for i in range(0, len(missing), batch_size)
+    ).apply_async()
+    return len(missing)
+
+
+@shared_task
+def render_invoices(export_id, language, order_ids, total, ids=None,
+                    filters=None):
+    """
+    Task to render and store the invoices of a batch of orders, zipping
+    the invoices of the export once every batch is done. Returns the
+    render stats of the worker process.
+    """
+    try:
+        with override(language):
+            for order in invoice_orders().filter(id__in=order_ids):
+                get_invoice(order)
+    except Exception:
+        set_export_status(export_id, state='FAILURE', rows=0, total=total)
+        raise
+    if add_export_rows(export_id, len(order_ids)) == total:
+        zip_invoices.delay(export_id, language, total, ids, filters)
+    return get_renderer().get_stats()
+
+
+@shared_task
+def zip_invoices(export_id, language, total, ids=None, filters=None):
+    """
+    Task to store a ZIP archive of the invoices of an export.
+    """
+    queryset = filter_export(Order.objects.all(), ids, filters)
+    try:
+        with override(language):
+            name = write_invoice_zip(queryset, f'{export_id}/invoices')
+    except Exception:
+        set_export_status(export_id, state='FAILURE', rows=0, total=total)
+        raise
+    set_export_status(
+        export_id, state='SUCCESS', rows=total, total=total, name=name
+    )
+    return name
+
+
+@shared_task(
+    autoretry_for=(OSError, smtplib.SMTPException),
+    retry_backoff=True,
+    max_retries=5
+)
+def send_outbox():
+    """
+    Task to send a batch of outbox e-mails over one mail connection,
+    chaining another run while full batches are claimed.
+    """
+    # messages enqueued from now on schedule a new drain.
+    cache.delete(OUTBOX_DRAIN_KEY)
+    claimed, sent = drain_outbox()
+    if claimed >= settings.MAIL_OUTBOX_BATCH_SIZE:
+        send_outbox.delay()
+    return sent
+
+
+@shared_task
+def delete_exports():
+    """
+    Task to delete order exports older than ORDER_EXPORT_TTL.
+    """
+    return delete_expired_exports()
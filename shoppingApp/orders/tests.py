@@ -1,3 +1,196 @@
-from django.test import TestCase
+from decimal import Decimal
+from unittest import mock
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from shop.models import Category, Product
+from .mail import drain_outbox, enqueue_mail
+from .models import Order, OutboxMessage
+from .pdf import PDFRenderer
 
-# Create your tests here.
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    MAIL_OUTBOX_BATCH_SIZE=10,
+    MAIL_OUTBOX_MAX_ATTEMPTS=2,
+)
+class DrainOutboxTests(TestCase):
+
+    def enqueue(self, count):
+        for i in range(count):
+            enqueue_mail(
+                f'Order nr. {i}', 'body', 'admin@myshop.com',
+                [f'customer{i}@example.com'],
+                [('order.pdf', b'%PDF', 'application/pdf')]
+            )
+
+    def failing_send(self, fail_subjects):
+        send_messages = EmailBackend.send_messages
+
+        def send(backend, messages):
+            if messages[0].subject in fail_subjects:
+                raise OSError('connection reset')
+            return send_messages(backend, messages)
+        return mock.patch.object(EmailBackend, 'send_messages', send)
+
+    def test_sends_batch_over_one_connection(self):
+        self.enqueue(3)
+        with mock.patch.object(
+            EmailBackend, 'open', autospec=True, return_value=True
+        ) as open_connection:
+            self.assertEqual(drain_outbox(), (3, 3))
+        self.assertEqual(open_connection.call_count, 1)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[0].attachments[0].filename, 'order.pdf')
+        self.assertFalse(
+            OutboxMessage.objects.filter(sent__isnull=True).exists()
+        )
+        # sent messages are not claimed again.
+        self.assertEqual(drain_outbox(), (0, 0))
+
+    def test_failed_message_is_retried(self):
+        self.enqueue(3)
+        with self.failing_send({'Order nr. 1'}):
+            self.assertEqual(drain_outbox(), (3, 2))
+        failed = OutboxMessage.objects.get(sent__isnull=True)
+        self.assertEqual(failed.attempts, 1)
+        self.assertIn('connection reset', failed.last_error)
+        self.assertEqual(failed.claim, '')
+
+        self.assertEqual(drain_outbox(), (1, 1))
+        self.assertEqual(len(mail.outbox), 3)
+        failed.refresh_from_db()
+        self.assertIsNotNone(failed.sent)
+        self.assertEqual(failed.attempts, 2)
+
+    def test_attempts_cap(self):
+        self.enqueue(1)
+        with self.failing_send({'Order nr. 0'}):
+            self.assertEqual(drain_outbox(), (1, 0))
+            self.assertEqual(drain_outbox(), (1, 0))
+        # out of attempts, the message is no longer claimed.
+        self.assertEqual(drain_outbox(), (0, 0))
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboxMessage.objects.get().attempts, 2)
+
+    def test_claimed_messages_are_skipped(self):
+        self.enqueue(2)
+        first = OutboxMessage.objects.order_by('id').first()
+        OutboxMessage.objects.filter(id=first.id).update(
+            claim='other', claimed=first.created
+        )
+        self.assertEqual(drain_outbox(), (1, 1))
+        self.assertEqual(mail.outbox[0].subject, 'Order nr. 1')
+
+
+@override_settings(
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    },
+    CART_STORAGE='cart.storage.SessionStorage',
+)
+class OrderCreateTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Tea', slug='tea')
+        cls.tea = Product.objects.create(
+            category=category, name='Green tea', slug='green-tea',
+            price=Decimal('10.00')
+        )
+        cls.cup = Product.objects.create(
+            category=category, name='Cup', slug='cup', price=Decimal('4.00')
+        )
+
+    def setUp(self):
+        for product in [self.tea, self.cup]:
+            self.client.post(
+                reverse('cart:cart_add', args=[product.id]),
+                {'quantity': 2}
+            )
+
+    def create_order(self):
+        return self.client.post(reverse('orders:order_create'), {
+            'first_name': 'Ada',
+            'last_name': 'Lovelace',
+            'email': 'ada@example.com',
+            'address': '1 Street',
+            'postal_code': '10001',
+            'city': 'New York',
+        })
+
+    def assertBackToCart(self, response, message):
+        self.assertRedirects(
+            response, reverse('cart:cart_detail'),
+            fetch_redirect_response=False
+        )
+        self.assertFalse(Order.objects.exists())
+        with mock.patch('cart.views.Recommender') as recommender:
+            recommender().suggest_products_for.return_value = []
+            response = self.client.get(reverse('cart:cart_detail'))
+        self.assertContains(response, message)
+
+    @mock.patch('orders.views.order_created.delay')
+    def test_order_is_created(self, order_created):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.create_order()
+        self.assertRedirects(
+            response, reverse('payment:process'),
+            fetch_redirect_response=False
+        )
+        order = Order.objects.get()
+        self.assertEqual(order.total, Decimal('28.00'))
+        order_created.assert_called_once_with(order.id)
+
+    @mock.patch('orders.views.order_created.delay')
+    def test_unavailable_product_returns_to_cart(self, order_created):
+        Product.objects.filter(id=self.cup.id).update(available=False)
+        self.assertBackToCart(
+            self.create_order(),
+            'Cup is no longer available and was removed from your cart.'
+        )
+        # the customer confirms the remaining cart.
+        self.create_order()
+        self.assertEqual(Order.objects.get().total, Decimal('20.00'))
+
+    @mock.patch('orders.views.order_created.delay')
+    def test_changed_price_returns_to_cart(self, order_created):
+        Product.objects.filter(id=self.tea.id).update(price=Decimal('12.00'))
+        self.assertBackToCart(
+            self.create_order(),
+            'The price of Green tea changed to $12.00.'
+        )
+        self.create_order()
+        order = Order.objects.get()
+        self.assertEqual(order.total, Decimal('32.00'))
+        self.assertEqual(
+            order.items.get(product=self.tea).price, Decimal('12.00')
+        )
+
+
+class PDFRendererTests(SimpleTestCase):
+
+    def setUp(self):
+        self.renderer = PDFRenderer()
+        # stand-in for WeasyPrint, which needs system libraries.
+        weasyprint = mock.Mock()
+        weasyprint.HTML.return_value.write_pdf.return_value = b'%PDF'
+        self.renderer.weasyprint = weasyprint
+        self.renderer.font_config = mock.Mock()
+
+    def test_logs_setup_and_render_times(self):
+        with self.assertLogs('orders.pdf', 'INFO') as logs:
+            self.assertEqual(self.renderer.render('<p>1</p>'), b'%PDF')
+            self.renderer.render('<p>2</p>')
+        self.assertEqual(len(logs.records), 3)
+        self.assertIn('Parsed 1 PDF stylesheets', logs.output[0])
+        self.assertIn('2 renders', logs.output[2])
+        stats = self.renderer.get_stats()
+        self.assertEqual(stats['renders'], 2)
+        self.assertIsNotNone(stats['setup_time'])
+        self.assertEqual(
+            stats['average_render_time'], stats['render_time'] / 2
+        )
@@ -1,14 +1,16 @@
-import weasyprint
+from django.contrib import messages
 from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import render, redirect, get_object_or_404
-from django.template.loader import render_to_string
-from django.contrib.staticfiles import finders
-from django.http import HttpResponse
+from django.db import transaction
+from django.utils.translation import gettext as _
 
 
-from cart.cart import Cart
+from cart.cart import get_cart
+from shop.models import Product
+from shop.money import to_cents
 from .models import OrderItem, Order
 from .forms import OrderCreateForm
+from .invoices import invoice_orders, invoice_response
 from .tasks import order_created
 # Create your views here.
 
@@ -17,7 +19,7 @@ from .tasks import order_created
 
 
 def order_create(request):
-    cart = Cart(request)
+    cart = get_cart(request)
     if request.method == 'POST':
         form = OrderCreateForm(request.POST)
         if form.is_valid():
@@ -25,48 +27,72 @@ def order_create(request):
             if cart.coupon:
                 order.coupon = cart.coupon
                 order.discount = cart.coupon.discount
-            order.save()    
-            for item in cart:
-                OrderItem.objects.create(
+            # validate current prices of all products in one query.
+            lines = list(cart)
+            prices = dict(
+                Product.objects.filter(
+                    id__in=[line.product_id for line in lines],
+                    available=True
+                ).values_list('id', 'price')
+            )
+            changed = False
+            for line in lines:
+                price = prices.get(line.product_id)
+                if price is None:
+                    cart.remove(line.product)
+                    messages.warning(request, _(
+                        '%(product)s is no longer available and was '
+                        'removed from your cart.'
+                    ) % {'product': line.product.name})
+                    changed = True
+                elif to_cents(price) != line.price_cents:
+                    cart.update_price(line.product, price)
+                    messages.warning(request, _(
+                        'The price of %(product)s changed to $%(price)s.'
+                    ) % {'product': line.product.name, 'price': price})
+                    changed = True
+            if changed or not lines:
+                # let the customer review the cart before ordering.
+                return redirect('cart:cart_detail')
+            items = [
+                OrderItem(
                     order=order,
-                    product=item['product'],
-                    price=item['price'],
-                    quantity=item['quantity']
+                    product_id=line.product_id,
+                    price=prices[line.product_id],
+                    quantity=line.quantity
                 )
-                # clear the cart.
-                cart.clear()
-                # Launch the asynchronous task
-                order_created.delay(order.id)
-                # set the order in the session.
-                request.session['order_id'] = order.id
-                # redirect the payment.
-                return redirect(
-                   'payment"process'
-                )
-            
-        else:
-            form = OrderCreateForm()
-        return render(
-            request,
-            'orders/order/create.html',
-            {'cart':cart, 'form': form}
-        )    
+                for line in lines
+            ]
+            order.set_totals(
+                sum(item.get_cost_cents() for item in items)
+            )
+            with transaction.atomic():
+                order.save()
+                OrderItem.objects.bulk_create(items)
+                # Launch the asynchronous task once the order is stored.
+                transaction.on_commit(lambda: order_created.delay(order.id))
+            # clear the cart.
+            cart.clear()
+            # set the order in the session.
+            request.session['order_id'] = order.id
+            # redirect the payment.
+            return redirect('payment:process')
+    else:
+        form = OrderCreateForm()
+    return render(
+        request,
+        'orders/order/create.html',
+        {'cart':cart, 'form': form}
+    )    
         
 @staff_member_required
 def admin_order_detail(request, order_id):
-    order = get_object_or_404(order, id=order_id)
+    order = get_object_or_404(Order, id=order_id)
     return render(
         request, 'admin/orders/order/detail.html', {'order':order}
     )
 
 @staff_member_required 
 def admin_order_pdf(request, order_id):
-    order = get_object_or_404(Order, id=order_id)
-    html = render_to_string('orders/order.pdf.html', {'order':order})
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'filename=order_{order.id}.pdf'
-    weasyprint.HTML(string=html).write_pdf(
-        response,
-        stylesheets=[weasyprint.CSS(finders.find('css/pdf.css'))],
-    )
-    return response
+    order = get_object_or_404(invoice_orders(), id=order_id)
+    return invoice_response(request, order)
@@ -1,3 +1,18 @@
 from django.contrib import admin
+from .models import StripeCoupon, StripeEvent
 
 # Register your models here.
+
+
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+    list_display = ['event_id', 'type', 'created', 'processed']
+    list_filter = ['type', 'processed']
+    search_fields = ['event_id']
+
+
+
+@admin.register(StripeCoupon)
+class StripeCouponAdmin(admin.ModelAdmin):
+    list_display = ['stripe_id', 'coupon', 'percent_off', 'created']
+    raw_id_fields = ['coupon']
@@ -0,0 +1,41 @@
+import importlib
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from .models import StripeCoupon
+
+
+def get_stripe():
+    """
+    Return the module used for Stripe API calls.
+    """
+    return importlib.import_module(settings.STRIPE_MODULE)
+
+
+def get_stripe_coupon_id(coupon, percent_off):
+    """
+    Return the id of the Stripe coupon for the given coupon and discount,
+    creating it in Stripe on first use only.
+    """
+    mapping = StripeCoupon.objects.filter(
+        coupon=coupon, percent_off=percent_off
+    ).values_list('stripe_id', flat=True).first()
+    if mapping:
+        return mapping
+    stripe_coupon = get_stripe().Coupon.create(
+        name=coupon.code,
+        percent_off=percent_off,
+        duration='once'
+    )
+    try:
+        with transaction.atomic():
+            StripeCoupon.objects.create(
+                coupon=coupon,
+                percent_off=percent_off,
+                stripe_id=stripe_coupon.id
+            )
+    except IntegrityError:
+        # a concurrent checkout stored its coupon first, use that one.
+        return StripeCoupon.objects.get(
+            coupon=coupon, percent_off=percent_off
+        ).stripe_id
+    return stripe_coupon.id
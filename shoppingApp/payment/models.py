@@ -1,3 +1,46 @@
 from django.db import models
+from coupons.models import Coupon
 
 # Create your models here.
+
+
+class StripeCoupon(models.Model):
+    """
+    Stripe coupon created for a shop coupon at a given discount.
+    """
+    coupon = models.ForeignKey(
+        Coupon,
+        related_name='stripe_coupons',
+        on_delete=models.CASCADE
+    )
+    percent_off = models.IntegerField()
+    stripe_id = models.CharField(max_length=255)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['coupon', 'percent_off'],
+                name='unique_stripe_coupon'
+            ),
+        ]
+
+    def __str__(self):
+        return self.stripe_id
+
+
+class StripeEvent(models.Model):
+    """
+    Stripe webhook event, stored once per Stripe event id.
+    """
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    created = models.DateTimeField(auto_now_add=True)
+    processed = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created']
+
+    def __str__(self):
+        return self.event_id
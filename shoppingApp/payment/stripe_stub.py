@@ -0,0 +1,38 @@
+"""
+Offline stand-in for the parts of the stripe module the shop calls,
+enabled with STRIPE_MODULE = 'payment.stripe_stub' for tests and
+benchmarks. Calls are recorded in ``calls``.
+"""
+import itertools
+import types
+
+api_key = None
+api_version = None
+calls = []
+_ids = itertools.count(1)
+
+
+def reset():
+    calls.clear()
+
+
+def _create(kind, prefix, **params):
+    calls.append((kind, params))
+    return types.SimpleNamespace(id=f'{prefix}_stub_{next(_ids)}', **params)
+
+
+class Coupon:
+    @staticmethod
+    def create(**params):
+        return _create('Coupon.create', 'coupon', **params)
+
+
+class Session:
+    @staticmethod
+    def create(**params):
+        session = _create('checkout.Session.create', 'cs', **params)
+        session.url = params.get('success_url', '')
+        return session
+
+
+checkout = types.SimpleNamespace(Session=Session)
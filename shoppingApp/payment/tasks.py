@@ -1,39 +1,116 @@
-from io import BytesIO
-import weasyprint
+from datetime import timedelta
+import stripe
 from celery import shared_task 
-from django.contrib.staticfiles import finders
-from django.core.mail import EmailMessage
-from django.template.loader import render_to_string
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from orders.invoices import get_invoice, invoice_orders
+from orders.mail import enqueue_mail
 from orders.models import Order
+from orders.pdf import get_renderer
+from shop.tasks import products_bought
+from .models import StripeEvent
 
 @shared_task 
 def payment_completed(order_id): 
     """
     Task to send an e-mail notification when an order is successfully paid.
+    Returns the render stats of the worker process.
     """
 
-    order = Order.objects.get(id=order_id)
+    order = invoice_orders().get(id=order_id)
     # create invoice e-mail
     subject = f'My shop - Invoice no. {order.id}'
     message = (
         'Please, find attached the invoice for your recent purchase.'
     )
-    email = EmailMessage(
-        subject, message, 'admin@myshop.com', [order.email]
+    # reuse the stored invoice, rendering it only if needed
+    name, _ = get_invoice(order)
+    with default_storage.open(name) as invoice:
+        pdf = invoice.read()
+
+    # queue the e-mail with the PDF attached
+    enqueue_mail(
+        subject, message, 'admin@myshop.com', [order.email],
+        [(f'order_{order.id}.pdf', pdf, 'application/pdf')]
+    )
+    return get_renderer().get_stats()
+
+
+def checkout_session_completed(session):
+    if session.mode != 'payment' or session.payment_status != 'paid':
+        return
+    try:
+        order = Order.objects.get(id=session.client_reference_id)
+    except Order.DoesNotExist:
+        return
+
+    # Mark order as paid 
+    order.paid = True
+    # store Stripe payment ID.
+    order.stripe_id = session.payment_intent
+    order.save()
+
+    items = list(order.items.values_list(
+        'product_id', 'product__category_id'
+    ))
+
+    # queue only once the event is marked processed, each callback on its
+    # own so a failing one does not lose the other.
+    # send the invoice
+    transaction.on_commit(
+        lambda: payment_completed.delay(order.id), robust=True
     )
-    # generate PDF
-    html = render_to_string('orders/order/pdf.html', {'order': order})
-    out = BytesIO()
-    stylesheets=[weasyprint.CSS(finders.find('css/pdf.css'))]
-    weasyprint.HTML(string=html).write_pdf(out, stylesheets=stylesheets)
+    # save items bought for product recommendations
+    transaction.on_commit(
+        lambda: products_bought.delay(items), robust=True
+    )
+
 
-    # Attach PDF File
-    email.attach(
-        f'order_{order.id}.pdf', out.getvalue(), 'application/pdf'
-    ) 
+EVENT_HANDLERS = {
+    'checkout.session.completed': checkout_session_completed,
+}
 
-    # send e-mail
-    email.send()
 
+@shared_task(
+    autoretry_for=(Exception,),
+    retry_backoff=True,
+    retry_backoff_max=600,
+    max_retries=8
+)
+def process_stripe_event(event_id):
+    """
+    Task to process a stored Stripe webhook event exactly once.
+    """
+    with transaction.atomic():
+        # marking the event first makes concurrent runs wait on the row,
+        # a failure rolls the mark back so the event is retried.
+        claimed = StripeEvent.objects.filter(
+            id=event_id, processed__isnull=True
+        ).update(processed=timezone.now())
+        if not claimed:
+            # already handled by an earlier run.
+            return False
+        event = StripeEvent.objects.get(id=event_id)
+        handler = EVENT_HANDLERS.get(event.type)
+        if handler:
+            data = stripe.Event.construct_from(event.payload, stripe.api_key)
+            handler(data.data.object)
+    return True
 
 
+@shared_task
+def requeue_stripe_events():
+    """
+    Task to queue again stored Stripe events that were never processed.
+    """
+    before = timezone.now() - timedelta(
+        seconds=settings.STRIPE_EVENT_RETRY_AFTER
+    )
+    event_ids = list(StripeEvent.objects.filter(
+        processed__isnull=True, created__lt=before
+    ).values_list('id', flat=True))
+    for event_id in event_ids:
+        process_stripe_event.delay(event_id)
+    return len(event_ids)
@@ -1,3 +1,201 @@
-from django.test import TestCase
+import hashlib
+import hmac
+import json
+import time
+from decimal import Decimal
+from unittest import mock
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from coupons.models import Coupon
+from orders.models import Order, OrderItem
+from shop.models import Category, Product
+from . import stripe_stub
+from .models import StripeCoupon, StripeEvent
+from .tasks import process_stripe_event
 
-# Create your tests here.
+
+@override_settings(
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    },
+    STRIPE_MODULE='payment.stripe_stub',
+)
+class PaymentProcessTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Tea', slug='tea')
+        cls.product = Product.objects.create(
+            category=category, name='Green tea', slug='green-tea',
+            price=Decimal('10.00')
+        )
+        now = timezone.now()
+        cls.coupon = Coupon.objects.create(
+            code='SUMMER', valid_from=now, valid_to=now, discount=10,
+            active=True
+        )
+
+    def setUp(self):
+        stripe_stub.reset()
+
+    def create_order(self):
+        order = Order.objects.create(
+            first_name='Ada', last_name='Lovelace', email='ada@example.com',
+            address='1 Street', postal_code='1000', city='London',
+            coupon=self.coupon, discount=self.coupon.discount
+        )
+        OrderItem.objects.create(
+            order=order, product=self.product, price=self.product.price,
+            quantity=2
+        )
+        return order
+
+    def checkout(self, order):
+        session = self.client.session
+        session['order_id'] = order.id
+        session.save()
+        return self.client.post(reverse('payment:process'))
+
+    def test_coupon_is_created_once_across_checkouts(self):
+        for _ in range(2):
+            response = self.checkout(self.create_order())
+            # the stub session sends the customer to the success url.
+            self.assertRedirects(
+                response, 'http://testserver' + reverse('payment:completed'),
+                fetch_redirect_response=False
+            )
+        kinds = [kind for kind, _ in stripe_stub.calls]
+        self.assertEqual(kinds.count('Coupon.create'), 1)
+        self.assertEqual(kinds.count('checkout.Session.create'), 2)
+        stripe_id = StripeCoupon.objects.get(coupon=self.coupon).stripe_id
+        # both sessions apply the same stripe coupon.
+        for kind, params in stripe_stub.calls:
+            if kind == 'checkout.Session.create':
+                self.assertEqual(
+                    params['discounts'], [{'coupon': stripe_id}]
+                )
+
+
+@override_settings(
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    },
+    STRIPE_WEBHOOK_SECRET='whsec_test',
+)
+class StripeWebhookTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Tea', slug='tea')
+        product = Product.objects.create(
+            category=category, name='Green tea', slug='green-tea',
+            price=Decimal('10.00')
+        )
+        cls.order = Order.objects.create(
+            first_name='Ada', last_name='Lovelace', email='ada@example.com',
+            address='1 Street', postal_code='1000', city='London'
+        )
+        OrderItem.objects.create(
+            order=cls.order, product=product, price=product.price,
+            quantity=1
+        )
+
+    def event(self, event_id='evt_1'):
+        return {
+            'id': event_id,
+            'object': 'event',
+            'type': 'checkout.session.completed',
+            'data': {
+                'object': {
+                    'id': 'cs_1',
+                    'object': 'checkout.session',
+                    'mode': 'payment',
+                    'payment_status': 'paid',
+                    'client_reference_id': str(self.order.id),
+                    'payment_intent': 'pi_1',
+                },
+            },
+        }
+
+    def deliver(self, event):
+        payload = json.dumps(event)
+        timestamp = int(time.time())
+        signature = hmac.new(
+            b'whsec_test', f'{timestamp}.{payload}'.encode(), hashlib.sha256
+        ).hexdigest()
+        with mock.patch(
+            'payment.webhooks.process_stripe_event.delay'
+        ) as delay, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/payment/webhook/', payload,
+                content_type='application/json',
+                HTTP_STRIPE_SIGNATURE=f't={timestamp},v1={signature}'
+            )
+        self.assertEqual(response.status_code, 200)
+        return delay
+
+    def process(self, event_id):
+        with mock.patch(
+            'payment.tasks.payment_completed.delay'
+        ) as payment_completed, mock.patch(
+            'payment.tasks.products_bought.delay'
+        ), self.captureOnCommitCallbacks(execute=True):
+            processed = process_stripe_event(event_id)
+        return processed, payment_completed
+
+    def test_first_delivery_stores_and_queues_event(self):
+        delay = self.deliver(self.event())
+        stored = StripeEvent.objects.get()
+        self.assertEqual(stored.event_id, 'evt_1')
+        self.assertEqual(stored.payload['data']['object']['id'], 'cs_1')
+        self.assertIsNone(stored.processed)
+        delay.assert_called_once_with(stored.id)
+
+    def test_duplicate_of_processed_event_is_ignored(self):
+        self.deliver(self.event())
+        stored = StripeEvent.objects.get()
+        self.process(stored.id)
+        delay = self.deliver(self.event())
+        delay.assert_not_called()
+        self.assertEqual(StripeEvent.objects.count(), 1)
+
+    def test_duplicate_of_unprocessed_event_is_requeued(self):
+        self.deliver(self.event())
+        stored = StripeEvent.objects.get()
+        delay = self.deliver(self.event())
+        delay.assert_called_once_with(stored.id)
+        self.assertEqual(StripeEvent.objects.count(), 1)
+
+    def test_event_is_processed_once(self):
+        self.deliver(self.event())
+        stored = StripeEvent.objects.get()
+        processed, payment_completed = self.process(stored.id)
+        self.assertTrue(processed)
+        payment_completed.assert_called_once_with(self.order.id)
+        self.order.refresh_from_db()
+        self.assertTrue(self.order.paid)
+        self.assertEqual(self.order.stripe_id, 'pi_1')
+
+        processed, payment_completed = self.process(stored.id)
+        self.assertFalse(processed)
+        payment_completed.assert_not_called()
+
+    def test_invoice_is_queued_when_recommender_fails(self):
+        self.deliver(self.event())
+        stored = StripeEvent.objects.get()
+        with mock.patch(
+            'payment.tasks.payment_completed.delay'
+        ) as payment_completed, mock.patch(
+            'payment.tasks.products_bought.delay',
+            side_effect=ConnectionError('redis is down')
+        ), self.assertLogs('django.test', 'ERROR'), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(process_stripe_event(stored.id))
+        payment_completed.assert_called_once_with(self.order.id)
+        stored.refresh_from_db()
+        self.assertIsNotNone(stored.processed)
@@ -1,31 +1,23 @@
-from decimal import Decimal
-
 from django.contrib.admin.views.decorators import staff_member_required
 
 import stripe
 from django.conf import settings
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
+from orders.invoices import invoice_orders, invoice_response
 from orders.models import Order
+from shop.money import to_cents
+from .clients import get_stripe, get_stripe_coupon_id
 
 # THIS is the code for generating a PDF invoice for existing orders using the administration site.
-import weasyprint
-from django.contrib.staticfiles import finders
-from django.http import HttpResponse
-from django.template.loader import render_to_string
 
 
 # Create your views here.
 
 @staff_member_required
 def admin_order_pdf(request, order_id):
-    order = get_object_or_404(Order, id=order_id)
-    html = render_to_string('orders/order/pdf.html', {'order': order})
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition']= f'filename=order_{order.id}.pdf'
-    weasyprint.HTML(string=html).write_pdf(response, stylesheets=[weasyprint.CSS(finders.find('css/pdf.css'))]
-)
-    return response
+    order = get_object_or_404(invoice_orders(), id=order_id)
+    return invoice_response(request, order)
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
 stripe.api_version = settings.STRIPE_API_VERSION
@@ -54,9 +46,9 @@ def payment_process(request):
         for item in order.items.all():
             session_data['line_items'].append(
                 {
-                    'price-data': {
-                        'unit_amount': int(item.price * Decimal('100')),
-                        'currecny':'usd',
+                    'price_data': {
+                        'unit_amount': to_cents(item.price),
+                        'currency': 'usd',
                         'product_data': {
                             'name': item.product.name,
                         },
@@ -68,15 +60,13 @@ def payment_process(request):
             # stripe coupon
 
         if order.coupon:
-            stripe_coupon = stripe.Coupon.create(
-                name=order.coupon.code,
-                percent_off=order.discount,
-                duartion='once'
+            stripe_coupon_id = get_stripe_coupon_id(
+                order.coupon, order.discount
             )
-            session_data['discounts'] = [{'coupon': stripe_coupon.id}]
+            session_data['discounts'] = [{'coupon': stripe_coupon_id}]
 
         # create stripe checkout session.
-        session = stripe.checkout.session.create(**session_data)
+        session = get_stripe().checkout.Session.create(**session_data)
         # redirect to stripe payment form 
         return redirect(session.url, code=303)
     
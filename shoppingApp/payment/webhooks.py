@@ -1,21 +1,21 @@
-from shop.models import Product
-from shop.recommender import Recommender
+import json
 import stripe 
 from django.conf import settings 
+from django.db import IntegrityError, transaction
 from django.http import HttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from orders.models import Order
-from .tasks import payment_completed
+from .models import StripeEvent
+from .tasks import process_stripe_event
 
 
 @csrf_exempt 
 def stripe_webhook(request):
     payload = request.body
-    sig_header = request.META['HTTP_STRIPE_SIGNATURE']
+    sig_header = request.META.get('HTTP_STRIPE_SIGNATURE', '')
     event = None
 
     try: 
-        event = stripe.Webhook.contruct_event(
+        event = stripe.Webhook.construct_event(
             payload, sig_header, settings.STRIPE_WEBHOOK_SECRET
         )
     except ValueError as e:
@@ -24,41 +24,23 @@ def stripe_webhook(request):
     except stripe.error.SignatureVerificationError as e:
         # invalid singnature.
         return HttpResponse(status=400)
-    
-    if event.type == 'checkout.session.completed':
-        session = event.data.object
-        if (
-            session.mode == 'payment'
-            and session.payment_status == 'paid' 
-        ):
-            try: 
-                order = Order.objects.get(id=session.client_reference_id)
-            except Order.DoesNotExist:
-                return HttpResponse(status=404)
 
-            # Mark order as paid 
-            order.paid = True
-            # store Stripe payment ID.
-            order.stripe_id = session.payment_intent
-            order.save()
+    # store the event once per Stripe event id.
+    try:
+        with transaction.atomic():
+            stored = StripeEvent.objects.create(
+                event_id=event.id,
+                type=event.type,
+                payload=json.loads(payload)
+            )
+            # process the event in the background.
+            transaction.on_commit(
+                lambda: process_stripe_event.delay(stored.id)
+            )
+    except IntegrityError:
+        stored = StripeEvent.objects.get(event_id=event.id)
+        if stored.processed is None:
+            # the first delivery was never processed, queue it again.
+            process_stripe_event.delay(stored.id)
 
-            # save itenms bought for product recommendations
-            product_ids = order.items.values_list('product_id')
-            products = Product.objects.filter(id__in=product_ids)
-            r = Recommender()
-            r.products_bought(products)
-            
-            # With this change when receiving a webhook notification for a completed checkout session, the 
-            # payment intent ID is stored in the stripe_id field of Order object.
-
-            # Launch asynchronous task 
-            payment_completed.delay(order.id)
-
-                
-    
     return HttpResponse(status=200)
-
-
-
-
-
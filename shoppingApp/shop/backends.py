@@ -0,0 +1,663 @@
+import functools
+import hashlib
+import heapq
+import itertools
+import time
+from collections import Counter, defaultdict
+
+import redis
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+def decay_weight(timestamp, epoch, half_life):
+    """
+    Return the score increment of a purchase made at timestamp, doubling
+    every half_life seconds past epoch. A half_life of 0 disables decay.
+    """
+    if not half_life:
+        return 1
+    return 2 ** ((timestamp - epoch) / half_life)
+
+
+class BaseBackend:
+    """
+    Storage for co-purchase scores, bestseller lists and precomputed
+    suggestions. Product ids are passed in and returned as integers.
+    """
+
+    def add_purchases(self, orders, max_partners, categories=None,
+                      max_bestsellers=0, half_life=0, timestamp=None,
+                      default_epoch=0):
+        """
+        Increment the score of every pair of products bought together, and
+        the bestseller scores of each product globally and within its
+        category. orders is an iterable of product id lists and categories
+        an optional {product_id: category_id} mapping.
+        Increments are weighted by decay_weight() at timestamp against the
+        stored epoch, read along with the increments. default_epoch is
+        stored if no epoch was.
+        Co-purchase sets are trimmed to max_partners after each product,
+        bestseller lists to max_bestsellers once per call.
+        """
+        raise NotImplementedError
+
+    def load_purchases(self, partners, max_partners):
+        """
+        Replace the co-purchase scores of the given products.
+        partners is an iterable of (product_id, {with_id: score}) pairs.
+        Returns the number of products loaded.
+        """
+        raise NotImplementedError
+
+    def load_bestsellers(self, bestsellers, max_bestsellers):
+        """
+        Replace bestseller lists from a {category_id: {product_id: score}}
+        mapping, where the None category holds the global list.
+        """
+        raise NotImplementedError
+
+    def trim_purchases(self, max_partners, max_bestsellers=0):
+        """
+        Keep only the top max_partners partners of every product and
+        the top max_bestsellers products of every bestseller list.
+        Returns the number of lists visited.
+        """
+        raise NotImplementedError
+
+    def purge_purchases(self, min_score):
+        """
+        Remove partners and bestsellers scoring below min_score.
+        Returns the number of lists visited.
+        """
+        raise NotImplementedError
+
+    def get_epoch(self, default):
+        """
+        Return the stored decay epoch, or default if none was stored.
+        """
+        raise NotImplementedError
+
+    def rebase(self, epoch, factor):
+        """
+        Store a new decay epoch and multiply every co-purchase and
+        bestseller score by factor.
+        Returns the number of lists visited.
+        """
+        raise NotImplementedError
+
+    def top_partners(self, product_ids, max_results):
+        """
+        Return the top partner ids of each of the given products.
+        """
+        raise NotImplementedError
+
+    def suggest(self, product_ids, max_results, category_ids=(),
+                max_bestsellers=0, precomputed=True):
+        """
+        Return (suggestions, bestsellers) in a single round trip.
+        suggestions are the top partners of a single product, read from
+        the precomputed suggestions when available and precomputed is True,
+        or the combined top partners of several products excluding the
+        products themselves. bestsellers holds the top max_bestsellers ids
+        of each category in category_ids followed by the global list.
+        """
+        raise NotImplementedError
+
+    def get_changed(self, count):
+        """
+        Return up to count products whose scores changed since their
+        suggestions were last stored.
+        """
+        raise NotImplementedError
+
+    def store_suggestions(self, product_ids, max_results):
+        """
+        Store the top max_results partners of each product as its
+        precomputed suggestions, and mark the product unchanged together
+        with the write so a failed refresh leaves it changed.
+        """
+        raise NotImplementedError
+
+    def clear(self, progress=None):
+        """
+        Remove all recommendation data. progress is called with the
+        number of items removed so far after each batch.
+        Returns the number of items removed.
+        """
+        raise NotImplementedError
+
+
+# Read the suggestions of a single product in one round trip.
+# KEYS[1] is the precomputed suggestions hash, KEYS[2] the co-purchase set
+# and KEYS[3..] the bestseller lists. ARGV[1] is the product id, ARGV[2]
+# the number of results, ARGV[3] the number of bestsellers per list and
+# ARGV[4] whether to use precomputed suggestions.
+SUGGEST_SCRIPT = """
+local n = tonumber(ARGV[2])
+local m = tonumber(ARGV[3])
+local suggestions = false
+if ARGV[4] == '1' then
+    suggestions = redis.call('HGET', KEYS[1], ARGV[1])
+end
+local result = {}
+if suggestions then
+    result[1] = suggestions
+else
+    result[1] = redis.call('ZREVRANGE', KEYS[2], 0, n - 1)
+end
+for i = 3, #KEYS do
+    result[i - 1] = redis.call('ZREVRANGE', KEYS[i], 0, m - 1)
+end
+return result
+"""
+
+# Store the purchases of a batch of orders in a single round trip, weighted
+# against the stored decay epoch. KEYS[1] is the epoch key and KEYS[2..]
+# the keys updated. ARGV[1] is the purchase timestamp, ARGV[2] the
+# half-life (0 disables decay), ARGV[3] the epoch stored if none was,
+# and ARGV[4..] (operation, key index, value) triples in order:
+# 'incr' increments member value of a sorted set by the weight, 'trim'
+# keeps its top value members and 'add' adds value to a set.
+ADD_PURCHASES_SCRIPT = """
+local weight = 1
+local half_life = tonumber(ARGV[2])
+if half_life > 0 then
+    local epoch = redis.call('GET', KEYS[1])
+    if not epoch then
+        epoch = ARGV[3]
+        redis.call('SET', KEYS[1], epoch)
+    end
+    weight = 2 ^ ((tonumber(ARGV[1]) - tonumber(epoch)) / half_life)
+end
+for i = 4, #ARGV, 3 do
+    local key = KEYS[tonumber(ARGV[i + 1])]
+    if ARGV[i] == 'incr' then
+        redis.call('ZINCRBY', key, weight, ARGV[i + 2])
+    elseif ARGV[i] == 'trim' then
+        redis.call('ZREMRANGEBYRANK', key, 0, -(tonumber(ARGV[i + 2]) + 1))
+    else
+        redis.call('SADD', key, ARGV[i + 2])
+    end
+end
+return tostring(weight)
+"""
+
+# Precompute the suggestions of changed products, removing each from the
+# changed set along with the write. KEYS[1] is the suggestions hash,
+# KEYS[2] the changed set and KEYS[3..] the co-purchase sets. ARGV[1] is
+# the number of suggestions and ARGV[2..] the product ids.
+STORE_SUGGESTIONS_SCRIPT = """
+local n = tonumber(ARGV[1])
+for i = 3, #KEYS do
+    local ids = redis.call('ZREVRANGE', KEYS[i], 0, n - 1)
+    -- store suggestions as a comma separated list of ids.
+    redis.call('HSET', KEYS[1], ARGV[i - 1], table.concat(ids, ','))
+    redis.call('SREM', KEYS[2], ARGV[i - 1])
+end
+return #KEYS - 2
+"""
+
+# Union the co-purchase sets of several products in a single round trip.
+# KEYS[1] is the cached result key, KEYS[2..ARGV[4] + 1] the co-purchase
+# sets and the remaining keys the bestseller lists. ARGV[1] is the cache
+# TTL, ARGV[2] the number of results, ARGV[3] the number of bestsellers
+# per list, ARGV[4] the number of co-purchase sets and ARGV[5..] the
+# product ids to exclude from the suggestions.
+UNION_SCRIPT = """
+local n = tonumber(ARGV[2])
+local m = tonumber(ARGV[3])
+local sets = tonumber(ARGV[4])
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('ZUNIONSTORE', KEYS[1], sets, unpack(KEYS, 2, sets + 1))
+    redis.call('ZREM', KEYS[1], unpack(ARGV, 5))
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+local result = {redis.call('ZREVRANGE', KEYS[1], 0, n - 1)}
+for i = sets + 2, #KEYS do
+    result[#result + 1] = redis.call('ZREVRANGE', KEYS[i], 0, m - 1)
+end
+return result
+"""
+
+
+class RedisBackend(BaseBackend):
+    """
+    Co-purchase scores stored as one Redis sorted set per product.
+    """
+    # commands sent per pipelined round trip for bulk operations.
+    batch_size = 500
+
+    def __init__(self, prefix='', **kwargs):
+        kwargs.setdefault('host', settings.REDIS_HOST)
+        kwargs.setdefault('port', settings.REDIS_PORT)
+        kwargs.setdefault('db', settings.REDIS_DB)
+        self.r = redis.Redis(**kwargs)
+        self.prefix = prefix
+        # precomputed top suggestions, one hash field per product id.
+        self.suggestions_key = f'{prefix}product:suggestions'
+        # products whose co-purchase sets changed since the last refresh.
+        self.dirty_key = f'{prefix}product:suggestions:dirty'
+        # decay epoch, outside product:* so clear() keeps it.
+        self.epoch_key = f'{prefix}recommender:decay:epoch'
+        self.add_purchases_script = self.r.register_script(
+            ADD_PURCHASES_SCRIPT
+        )
+        self.store_suggestions_script = self.r.register_script(
+            STORE_SUGGESTIONS_SCRIPT
+        )
+        self.suggest_script = self.r.register_script(SUGGEST_SCRIPT)
+        self.union_script = self.r.register_script(UNION_SCRIPT)
+
+    def get_product_key(self, id):
+        return f'{self.prefix}product:{id}:purchased_with'
+
+    def get_bestsellers_key(self, category_id=None):
+        if category_id is None:
+            return f'{self.prefix}product:bestsellers'
+        return f'{self.prefix}product:bestsellers:category:{category_id}'
+
+    def get_union_key(self, product_ids):
+        # canonical key for a set of products, independent of order.
+        flat_ids = ','.join(str(id) for id in sorted(product_ids))
+        digest = hashlib.sha1(flat_ids.encode()).hexdigest()
+        return f'{self.prefix}product:suggestions:union:{digest}'
+
+    def _trim(self, client, key, max_partners):
+        # keep only the top max_partners members of the sorted set.
+        if max_partners:
+            client.zremrangebyrank(key, 0, -(max_partners + 1))
+
+    def _scan(self, *patterns):
+        for pattern in patterns:
+            yield from self.r.scan_iter(match=pattern, count=self.batch_size)
+
+    def add_purchases(self, orders, max_partners, categories=None,
+                      max_bestsellers=0, half_life=0, timestamp=None,
+                      default_epoch=0):
+        categories = categories or {}
+        # script keys by index, the epoch key first.
+        keys = {self.epoch_key: 1}
+        args = []
+
+        def command(operation, key, value):
+            index = keys.setdefault(key, len(keys) + 1)
+            args.extend([operation, index, value])
+
+        bestsellers = set()
+        for product_ids in orders:
+            for product_id in product_ids:
+                key = self.get_product_key(product_id)
+                for with_id in product_ids:
+                    # get the other products bought with each product.
+                    if product_id != with_id:
+                        # increment score for product purchased together.
+                        command('incr', key, with_id)
+                if max_partners:
+                    command('trim', key, max_partners)
+                # count the sale globally and within its category.
+                lists = [self.get_bestsellers_key()]
+                if product_id in categories:
+                    lists.append(
+                        self.get_bestsellers_key(categories[product_id])
+                    )
+                for key in lists:
+                    command('incr', key, product_id)
+                bestsellers.update(lists)
+            for product_id in product_ids:
+                command('add', self.dirty_key, product_id)
+        if max_bestsellers:
+            for key in bestsellers:
+                command('trim', key, max_bestsellers)
+        if not args:
+            return
+        if timestamp is None:
+            timestamp = time.time()
+        self.add_purchases_script(
+            keys=list(keys),
+            args=[timestamp, half_life, default_epoch, *args]
+        )
+
+    def load_purchases(self, partners, max_partners):
+        count = 0
+        with self.r.pipeline(transaction=False) as pipe:
+            for product_id, scores in partners:
+                key = self.get_product_key(product_id)
+                pipe.delete(key)
+                if scores:
+                    pipe.zadd(key, scores)
+                    self._trim(pipe, key, max_partners)
+                pipe.sadd(self.dirty_key, product_id)
+                count += 1
+                if count % self.batch_size == 0:
+                    pipe.execute()
+            pipe.execute()
+        return count
+
+    def load_bestsellers(self, bestsellers, max_bestsellers):
+        with self.r.pipeline(transaction=False) as pipe:
+            for count, (category_id, scores) in enumerate(bestsellers.items()):
+                key = self.get_bestsellers_key(category_id)
+                pipe.delete(key)
+                if scores:
+                    pipe.zadd(key, scores)
+                    self._trim(pipe, key, max_bestsellers)
+                if count % self.batch_size == 0:
+                    pipe.execute()
+            pipe.execute()
+
+    def trim_purchases(self, max_partners, max_bestsellers=0):
+        count = 0
+        with self.r.pipeline(transaction=False) as pipe:
+            for pattern, max_members in [
+                (self.get_product_key('*'), max_partners),
+                (self.get_bestsellers_key() + '*', max_bestsellers),
+            ]:
+                if not max_members:
+                    continue
+                for key in self._scan(pattern):
+                    self._trim(pipe, key, max_members)
+                    count += 1
+                    if count % self.batch_size == 0:
+                        pipe.execute()
+            pipe.execute()
+        return count
+
+    def purge_purchases(self, min_score):
+        count = 0
+        with self.r.pipeline(transaction=False) as pipe:
+            for key in self._scan(
+                self.get_product_key('*'), self.get_bestsellers_key() + '*'
+            ):
+                pipe.zremrangebyscore(key, '-inf', f'({min_score}')
+                count += 1
+                if count % self.batch_size == 0:
+                    pipe.execute()
+            pipe.execute()
+        return count
+
+    def get_epoch(self, default):
+        epoch = self.r.get(self.epoch_key)
+        return float(epoch) if epoch is not None else default
+
+    def rebase(self, epoch, factor):
+        # the epoch moves first, increments racing the rescale are then
+        # undercounted rather than inflated.
+        self.r.set(self.epoch_key, repr(epoch))
+        count = 0
+        with self.r.pipeline(transaction=False) as pipe:
+            for key in self._scan(
+                self.get_product_key('*'), self.get_bestsellers_key() + '*'
+            ):
+                # scale the sorted set in place.
+                pipe.zunionstore(key, {key: factor})
+                count += 1
+                if count % self.batch_size == 0:
+                    pipe.execute()
+            pipe.execute()
+        return count
+
+    def top_partners(self, product_ids, max_results):
+        with self.r.pipeline(transaction=False) as pipe:
+            for product_id in product_ids:
+                # read just the top max_results members.
+                pipe.zrange(
+                    self.get_product_key(product_id),
+                    0, max_results - 1, desc=True
+                )
+            results = pipe.execute()
+        return [[int(id) for id in ids] for ids in results]
+
+    def suggest(self, product_ids, max_results, category_ids=(),
+                max_bestsellers=0, precomputed=True):
+        bestseller_keys = [
+            self.get_bestsellers_key(id) for id in category_ids
+        ] + [self.get_bestsellers_key()]
+        if len(product_ids) == 1:
+            result = self.suggest_script(
+                keys=[
+                    self.suggestions_key,
+                    self.get_product_key(product_ids[0]),
+                    *bestseller_keys
+                ],
+                args=[
+                    product_ids[0], max_results, max_bestsellers,
+                    int(precomputed)
+                ]
+            )
+            if isinstance(result[0], bytes):
+                # precomputed suggestions, a comma separated list of ids.
+                result[0] = [id for id in result[0].split(b',') if id]
+        else:
+            # the union is cached under a key shared by identical carts.
+            keys = [self.get_product_key(id) for id in product_ids]
+            result = self.union_script(
+                keys=[self.get_union_key(product_ids), *keys, *bestseller_keys],
+                args=[
+                    settings.RECOMMENDER_UNION_TTL, max_results,
+                    max_bestsellers, len(keys), *product_ids
+                ]
+            )
+        suggestions, *bestsellers = [
+            [int(id) for id in ids] for ids in result
+        ]
+        return suggestions[:max_results], bestsellers
+
+    def get_changed(self, count):
+        # read without removing, store_suggestions() removes them.
+        return [
+            int(id) for id in self.r.srandmember(self.dirty_key, count) or []
+        ]
+
+    def store_suggestions(self, product_ids, max_results):
+        if product_ids:
+            self.store_suggestions_script(
+                keys=[
+                    self.suggestions_key, self.dirty_key,
+                    *[self.get_product_key(id) for id in product_ids]
+                ],
+                args=[max_results, *product_ids]
+            )
+
+    def clear(self, progress=None):
+        # walk keys by prefix and UNLINK them in batches, so large sets are
+        # freed in the background instead of blocking Redis.
+        count = 0
+        batch = []
+        for key in self._scan(f'{self.prefix}product:*'):
+            batch.append(key)
+            if len(batch) == self.batch_size:
+                count += self._unlink(batch, progress, count)
+                batch = []
+        if batch:
+            count += self._unlink(batch, progress, count)
+        return count
+
+    def _unlink(self, keys, progress, count):
+        self.r.unlink(*keys)
+        if progress:
+            progress(count + len(keys))
+        return len(keys)
+
+
+class MemoryBackend(BaseBackend):
+    """
+    In-process backend keeping a dict of partner scores per product.
+    Useful for tests and benchmarks, data is not shared between processes.
+    """
+
+    def __init__(self):
+        self.purchases = defaultdict(dict)
+        # bestseller scores per category id, None for the global list.
+        self.bestsellers = defaultdict(dict)
+        self.changed = set()
+        self.suggestions = {}
+        # cached unions as {product ids: (expires, ids)}.
+        self.unions = {}
+        self.epoch = None
+
+    def _rank(self, scores):
+        # order ties by member like Redis, which compares them as strings.
+        return lambda id: (scores[id], str(id))
+
+    def _trim(self, scores, max_partners):
+        if max_partners and len(scores) > max_partners:
+            top = heapq.nlargest(max_partners, scores, key=self._rank(scores))
+            top = {id: scores[id] for id in top}
+            scores.clear()
+            scores.update(top)
+
+    def _top(self, scores, max_results):
+        return heapq.nlargest(max_results, scores, key=self._rank(scores))
+
+    def add_purchases(self, orders, max_partners, categories=None,
+                      max_bestsellers=0, half_life=0, timestamp=None,
+                      default_epoch=0):
+        categories = categories or {}
+        if timestamp is None:
+            timestamp = time.time()
+        if half_life and self.epoch is None:
+            self.epoch = default_epoch
+        weight = decay_weight(timestamp, self.get_epoch(None), half_life)
+        bestsellers = set()
+        for product_ids in orders:
+            for product_id in product_ids:
+                scores = self.purchases[product_id]
+                for with_id in product_ids:
+                    if product_id != with_id:
+                        scores[with_id] = scores.get(with_id, 0) + weight
+                self._trim(scores, max_partners)
+                lists = [None]
+                if product_id in categories:
+                    lists.append(categories[product_id])
+                for category_id in lists:
+                    scores = self.bestsellers[category_id]
+                    scores[product_id] = scores.get(product_id, 0) + weight
+                bestsellers.update(lists)
+            self.changed.update(product_ids)
+        # trimmed once per call, like the Redis backend.
+        for category_id in bestsellers:
+            self._trim(self.bestsellers[category_id], max_bestsellers)
+
+    def load_purchases(self, partners, max_partners):
+        count = 0
+        for product_id, scores in partners:
+            self.purchases[product_id] = dict(scores)
+            self._trim(self.purchases[product_id], max_partners)
+            self.changed.add(product_id)
+            count += 1
+        return count
+
+    def load_bestsellers(self, bestsellers, max_bestsellers):
+        for category_id, scores in bestsellers.items():
+            self.bestsellers[category_id] = dict(scores)
+            self._trim(self.bestsellers[category_id], max_bestsellers)
+
+    def trim_purchases(self, max_partners, max_bestsellers=0):
+        count = 0
+        for lists, max_members in [
+            (self.purchases, max_partners),
+            (self.bestsellers, max_bestsellers),
+        ]:
+            if not max_members:
+                continue
+            for scores in lists.values():
+                self._trim(scores, max_members)
+            count += len(lists)
+        return count
+
+    def purge_purchases(self, min_score):
+        count = 0
+        for lists in [self.purchases, self.bestsellers]:
+            for key, scores in list(lists.items()):
+                scores = {
+                    id: score for id, score in scores.items()
+                    if score >= min_score
+                }
+                if scores:
+                    lists[key] = scores
+                else:
+                    del lists[key]
+                count += 1
+        return count
+
+    def get_epoch(self, default):
+        return self.epoch if self.epoch is not None else default
+
+    def rebase(self, epoch, factor):
+        self.epoch = epoch
+        count = 0
+        for lists in [self.purchases, self.bestsellers]:
+            for scores in lists.values():
+                for id in scores:
+                    scores[id] *= factor
+                count += 1
+        return count
+
+    def top_partners(self, product_ids, max_results):
+        return [
+            self._top(self.purchases.get(product_id, {}), max_results)
+            for product_id in product_ids
+        ]
+
+    def suggest(self, product_ids, max_results, category_ids=(),
+                max_bestsellers=0, precomputed=True):
+        if len(product_ids) == 1:
+            suggestions = None
+            if precomputed:
+                suggestions = self.suggestions.get(product_ids[0])
+            if suggestions is None:
+                suggestions = self.top_partners(product_ids, max_results)[0]
+        else:
+            suggestions = self._union(product_ids)
+        bestsellers = [
+            self._top(self.bestsellers.get(id, {}), max_bestsellers)
+            for id in [*category_ids, None]
+        ]
+        return suggestions[:max_results], bestsellers
+
+    def _union(self, product_ids):
+        key = frozenset(product_ids)
+        now = time.monotonic()
+        expires, ids = self.unions.get(key, (0, None))
+        if expires <= now:
+            scores = Counter()
+            for product_id in product_ids:
+                scores.update(self.purchases.get(product_id, {}))
+            for product_id in product_ids:
+                scores.pop(product_id, None)
+            ids = sorted(scores, key=self._rank(scores), reverse=True)
+            self.unions[key] = (now + settings.RECOMMENDER_UNION_TTL, ids)
+        return ids
+
+    def get_changed(self, count):
+        return list(itertools.islice(self.changed, count))
+
+    def store_suggestions(self, product_ids, max_results):
+        for product_id, ids in zip(
+            product_ids, self.top_partners(product_ids, max_results)
+        ):
+            self.suggestions[product_id] = ids
+            self.changed.discard(product_id)
+
+    def clear(self, progress=None):
+        count = (
+            len(self.purchases) + len(self.bestsellers) + len(self.suggestions)
+        )
+        self.purchases.clear()
+        self.bestsellers.clear()
+        self.changed.clear()
+        self.suggestions.clear()
+        self.unions.clear()
+        if progress:
+            progress(count)
+        return count
+
+
+@functools.cache
+def get_backend():
+    """
+    Return the backend configured in RECOMMENDER_BACKEND,
+    shared by every Recommender in the process.
+    """
+    return import_string(settings.RECOMMENDER_BACKEND)()
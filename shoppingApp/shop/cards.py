@@ -0,0 +1,83 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils.translation import get_language
+from .models import Product
+
+
+class ProductCard:
+    """
+    Lightweight, cacheable view of a product for listings.
+    """
+    __slots__ = ['id', 'name', 'slug', 'price', 'image_url', 'category_id']
+
+    def __init__(self, id, name, slug, price, image_url, category_id):
+        self.id = id
+        self.name = name
+        self.slug = slug
+        self.price = price
+        self.image_url = image_url
+        self.category_id = category_id
+
+    @classmethod
+    def from_product(cls, product):
+        return cls(
+            product.id,
+            product.safe_translation_getter('name', any_language=True),
+            product.safe_translation_getter('slug', any_language=True),
+            product.price,
+            product.image.url if product.image else '',
+            product.category_id,
+        )
+
+    def as_tuple(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def get_absolute_url(self):
+        return reverse('shop:product_detail', args=[self.id, self.slug])
+
+    def __str__(self):
+        return self.name or 'Unnamed Product'
+
+
+def get_card_key(product_id, language):
+    return f'product_card:{language}:{product_id}'
+
+
+def get_product_cards(product_ids, language=None):
+    """
+    Return the cards of the given products in the same order, skipping
+    products that do not exist. Cached cards are read with one cache call
+    and misses are fetched with one query with translations prefetched.
+    """
+    language = language or get_language() or settings.LANGUAGE_CODE
+    product_ids = list(product_ids)
+    keys = {get_card_key(id, language): id for id in product_ids}
+    cards = {
+        keys[key]: ProductCard(*value)
+        for key, value in cache.get_many(keys).items()
+    }
+    missing = [id for id in product_ids if id not in cards]
+    if missing:
+        products = Product.objects.language(language).filter(
+            id__in=missing
+        ).prefetch_related('translations')
+        fetched = {}
+        for product in products:
+            card = ProductCard.from_product(product)
+            cards[card.id] = card
+            fetched[get_card_key(card.id, language)] = card.as_tuple()
+        cache.set_many(fetched, settings.PRODUCT_CARD_CACHE_TIMEOUT)
+    # keep the order of product_ids with dict lookups.
+    return [cards[id] for id in product_ids if id in cards]
+
+
+def invalidate_product_cards(product_ids):
+    """
+    Remove the cached cards of the given products in every language.
+    """
+    cache.delete_many([
+        get_card_key(id, language)
+        for id in product_ids
+        for language, _ in settings.LANGUAGES
+    ])
@@ -0,0 +1,127 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+from shop.backends import RedisBackend
+from shop.recommender import Recommender
+
+
+def percentiles(timings):
+    # p50, p95 and p99 in milliseconds.
+    cuts = statistics.quantiles(timings, n=100)
+    return [cuts[49] * 1000, cuts[94] * 1000, cuts[98] * 1000]
+
+
+class Command(BaseCommand):
+    help = 'Measure ingestion and suggestion latency of recommender backends.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backend',
+            action='append',
+            help='Dotted path of a backend class, can be repeated '
+                 '(defaults to the Redis and in-memory backends).'
+        )
+        parser.add_argument(
+            '--products',
+            type=int,
+            nargs='+',
+            default=[10000, 100000, 1000000],
+            help='Catalog sizes to benchmark.'
+        )
+        parser.add_argument(
+            '--orders',
+            type=int,
+            default=20000,
+            help='Orders ingested per run.'
+        )
+        parser.add_argument(
+            '--max-items',
+            type=int,
+            default=8,
+            help='Maximum number of products per order.'
+        )
+        parser.add_argument(
+            '--queries',
+            type=int,
+            default=1000,
+            help='Suggestion lookups timed per run.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Orders ingested per orders_bought call.'
+        )
+        parser.add_argument('--seed', type=int, default=42)
+
+    def make_backend(self, path):
+        backend_class = import_string(path)
+        if issubclass(backend_class, RedisBackend):
+            # keep benchmark data apart from the live recommendations.
+            return backend_class(prefix='benchmark:')
+        return backend_class()
+
+    def handle(self, *args, **options):
+        backends = options['backend'] or [
+            'shop.backends.RedisBackend',
+            'shop.backends.MemoryBackend',
+        ]
+        for path in backends:
+            for products in options['products']:
+                self.run(path, products, options)
+
+    def run(self, path, products, options):
+        rng = random.Random(options['seed'])
+
+        def product_id():
+            # skew purchases towards a small set of popular products.
+            return int(products * rng.random() ** 3) + 1
+
+        orders = [
+            [product_id() for _ in range(rng.randint(2, options['max_items']))]
+            for _ in range(options['orders'])
+        ]
+        backend = self.make_backend(path)
+        r = Recommender(backend=backend)
+        try:
+            batch_size = options['batch_size']
+            start = time.perf_counter()
+            for i in range(0, len(orders), batch_size):
+                r.orders_bought(orders[i:i + batch_size])
+            ingestion = time.perf_counter() - start
+
+            start = time.perf_counter()
+            refreshed = r.refresh_suggestions()
+            refresh = time.perf_counter() - start
+
+            single, multi = [], []
+            for _ in range(options['queries']):
+                order = rng.choice(orders)
+                start = time.perf_counter()
+                r.suggest_product_ids_for(order[:1], 4)
+                single.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                r.suggest_product_ids_for(order, 4)
+                multi.append(time.perf_counter() - start)
+        finally:
+            backend.clear()
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'{path} - {products} products'
+        ))
+        self.stdout.write(
+            f'  ingestion: {len(orders) / ingestion:,.0f} orders/s '
+            f'({ingestion:.2f}s for {len(orders)} orders)'
+        )
+        self.stdout.write(
+            f'  refresh:   {refreshed} products in {refresh:.2f}s'
+        )
+        for name, timings in [('single', single), ('multi', multi)]:
+            p50, p95, p99 = percentiles(timings)
+            self.stdout.write(
+                f'  {name + ":":<10} p50 {p50:.3f}ms  '
+                f'p95 {p95:.3f}ms  p99 {p99:.3f}ms'
+            )
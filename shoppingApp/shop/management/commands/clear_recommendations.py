@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from shop.recommender import Recommender
+from shop.tasks import clear_recommendations
+
+
+class Command(BaseCommand):
+    help = 'Remove all product recommendation data.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--async',
+            action='store_true',
+            dest='run_async',
+            help='Run the clear as a Celery task.'
+        )
+
+    def handle(self, *args, **options):
+        if options['run_async']:
+            result = clear_recommendations.delay()
+            self.stdout.write(f'Queued clear_recommendations task {result.id}.')
+            return
+
+        def progress(removed):
+            self.stdout.write(f'Removed {removed} keys...')
+
+        r = Recommender()
+        removed = r.clear_purchases(progress)
+        self.stdout.write(self.style.SUCCESS(
+            f'Removed {removed} recommendation keys.'
+        ))
@@ -0,0 +1,184 @@
+import datetime
+import functools
+import itertools
+import time
+from array import array
+from collections import Counter, defaultdict
+from operator import itemgetter
+
+from django.core.management.base import BaseCommand
+from orders.models import OrderItem
+from shop.recommender import Recommender
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    # fall back to the pure Python builder.
+    np = sparse = None
+
+
+def iter_orders(rows, get_weight, bestsellers):
+    """
+    Group (order_id, product_id, category_id, created) rows sorted by
+    order into (weight, product id list) pairs, counting each product
+    sale in the bestsellers mapping along the way.
+    """
+    for order_id, group in itertools.groupby(rows, key=itemgetter(0)):
+        group = list(group)
+        weight = get_weight(group[0][3].timestamp())
+        product_ids = []
+        for _, product_id, category_id, _ in group:
+            if product_id not in product_ids:
+                bestsellers[None][product_id] += weight
+                bestsellers[category_id][product_id] += weight
+                product_ids.append(product_id)
+        yield weight, product_ids
+
+
+def build_sparse(orders, max_partners, stats):
+    """
+    Build the product x product co-occurrence matrix as A.T @ W @ A,
+    where A is the sparse order x product incidence matrix and W the
+    diagonal matrix of order weights.
+    """
+    product_index = {}
+    rows, cols, weights = array('q'), array('q'), array('d')
+    for row, (weight, product_ids) in enumerate(orders):
+        for product_id in product_ids:
+            rows.append(row)
+            cols.append(product_index.setdefault(product_id, len(product_index)))
+        weights.append(weight)
+        stats['orders'] += 1
+    stats['lines'] = len(rows)
+    if not product_index:
+        return
+    rows = np.frombuffer(rows, dtype=np.int64)
+    cols = np.frombuffer(cols, dtype=np.int64)
+    incidence = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.int32), (rows, cols)),
+        shape=(stats['orders'], len(product_index))
+    )
+    # count a product once per order.
+    incidence.data[:] = 1
+    weights = sparse.diags(np.frombuffer(weights, dtype=np.float64))
+    matrix = (incidence.T @ weights @ incidence).tocsr()
+    matrix.setdiag(0)
+    matrix.eliminate_zeros()
+
+    product_ids = np.fromiter(product_index, dtype=np.int64)
+    for i in range(matrix.shape[0]):
+        start, end = matrix.indptr[i], matrix.indptr[i + 1]
+        scores = matrix.data[start:end]
+        partners = matrix.indices[start:end]
+        if max_partners and len(scores) > max_partners:
+            top = np.argpartition(-scores, max_partners)[:max_partners]
+            scores, partners = scores[top], partners[top]
+        stats['pairs'] += len(scores)
+        yield int(product_ids[i]), dict(
+            zip(product_ids[partners].tolist(), scores.tolist())
+        )
+
+
+def build_counters(orders, max_partners, stats):
+    """
+    Build the co-occurrence counts with a dict of counters.
+    """
+    matrix = defaultdict(Counter)
+    for weight, product_ids in orders:
+        stats['orders'] += 1
+        stats['lines'] += len(product_ids)
+        product_ids = set(product_ids)
+        for product_id in product_ids:
+            counter = matrix[product_id]
+            for with_id in product_ids:
+                if with_id != product_id:
+                    counter[with_id] += weight
+    for product_id, counter in matrix.items():
+        scores = dict(counter.most_common(max_partners or None))
+        stats['pairs'] += len(scores)
+        yield product_id, scores
+
+
+class Command(BaseCommand):
+    help = 'Rebuild product recommendations from paid order history.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            type=datetime.date.fromisoformat,
+            help='Only use orders created on or after this date (YYYY-MM-DD).'
+        )
+        parser.add_argument(
+            '--until',
+            type=datetime.date.fromisoformat,
+            help='Only use orders created on or before this date (YYYY-MM-DD).'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=10000,
+            help='Order lines fetched from the database per chunk.'
+        )
+        parser.add_argument(
+            '--max-partners',
+            type=int,
+            default=None,
+            help='Partners to keep per product '
+                 '(defaults to RECOMMENDER_MAX_PARTNERS).'
+        )
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Remove all existing recommendation data first.'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Build the matrix and print stats without writing to Redis.'
+        )
+
+    def handle(self, *args, **options):
+        r = Recommender(max_partners=options['max_partners'])
+        items = OrderItem.objects.filter(order__paid=True)
+        if options['since']:
+            items = items.filter(order__created__date__gte=options['since'])
+        if options['until']:
+            items = items.filter(order__created__date__lte=options['until'])
+        rows = items.order_by('order_id').values_list(
+            'order_id', 'product_id', 'product__category_id', 'order__created'
+        ).iterator(chunk_size=options['chunk_size'])
+
+        start = time.perf_counter()
+        stats = Counter(orders=0, lines=0, pairs=0)
+        build = build_sparse if sparse is not None else build_counters
+        self.stdout.write(f'Building co-occurrence matrix with {build.__name__}.')
+        bestsellers = defaultdict(Counter)
+        # weights of every order are relative to the current epoch.
+        get_weight = r.get_weight
+        if r.half_life:
+            get_weight = functools.partial(r.get_weight, epoch=r.get_epoch())
+        orders = iter_orders(rows, get_weight, bestsellers)
+        partners = build(orders, r.max_partners, stats)
+
+        if options['dry_run']:
+            products = sum(1 for _ in partners)
+        else:
+            if options['clear']:
+                r.clear_purchases()
+            products = r.load_purchases(partners)
+            r.load_bestsellers(bestsellers)
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'{stats["orders"]} orders, '
+            f'{stats["lines"]} order lines, {products} products, '
+            f'{stats["pairs"]} product pairs, '
+            f'{len(bestsellers)} bestseller lists in {elapsed:.2f}s.'
+        )
+        if options['dry_run']:
+            self.stdout.write('Dry run, nothing was written.')
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Loaded recommendations for {products} products.'
+            ))
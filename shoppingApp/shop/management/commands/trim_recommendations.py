@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from shop.recommender import Recommender
+
+
+class Command(BaseCommand):
+    help = 'Trim co-purchase sets and bestseller lists to their configured size.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-partners',
+            type=int,
+            default=None,
+            help='Partners to keep per product '
+                 '(defaults to RECOMMENDER_MAX_PARTNERS).'
+        )
+
+    def handle(self, *args, **options):
+        r = Recommender(max_partners=options['max_partners'])
+        if r.half_life:
+            r.rebase_purchases()
+            count = r.purge_purchases()
+            self.stdout.write(self.style.SUCCESS(
+                f'Purged decayed partners from {count} co-purchase sets.'
+            ))
+        if not r.max_partners and not r.max_bestsellers:
+            self.stdout.write('Trimming is disabled, nothing to do.')
+            return
+        count = r.trim_purchases()
+        self.stdout.write(self.style.SUCCESS(
+            f'Trimmed {count} lists to {r.max_partners} partners '
+            f'and {r.max_bestsellers} bestsellers.'
+        ))
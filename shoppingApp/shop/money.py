@@ -0,0 +1,30 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+# Amounts are handled as integer cents, so sums are exact integer
+# arithmetic. Prices are still stored as decimals and converted at the
+# edges: cart storage, order totals and Stripe amounts.
+
+CENT = Decimal('0.01')
+
+
+def to_cents(amount):
+    """
+    Convert a Decimal, string or integer amount of dollars to cents.
+    """
+    return int(
+        (Decimal(amount) * 100).to_integral_value(rounding=ROUND_HALF_UP)
+    )
+
+
+def from_cents(cents):
+    """
+    Convert cents to a Decimal amount of dollars with two decimal places.
+    """
+    return (Decimal(int(cents)) / 100).quantize(CENT)
+
+
+def percent_of(cents, percent):
+    """
+    Return percent % of a non-negative amount of cents, rounding half up.
+    """
+    return (cents * percent + 50) // 100
@@ -1,73 +1,223 @@
-import redis 
+import math
+import time
 from django.conf import settings
-from . models import Product
+from django.core.exceptions import ImproperlyConfigured
+from . backends import decay_weight, get_backend
+from . cards import get_product_cards
 
-# Connect to redis 
-
-r = redis.Redis(
-    host=settings.REDIS_HOST,
-    port=settings.REDIS_PORT,
-    db=settings.REDIS_DB
-)
 
 class Recommender:
-    def get_product_key(self, id):
-        return f'product:{id}:purchased_with'
-    
-    def products_bought(self, products):
-        product_ids = [p.id for p in products]
-        for product_id in product_ids:
-            for with_id in product_ids:
-                # get the other products bought with each product.
-                if product_id != with_id:
-                    # increment score for product purchased together.
-                    r.zincrby(
-                        self.get_product_key(product_id), 1, with_id
-                    )
+    # largest weight exponent, in half-lives past the epoch, reached
+    # between periodic rebases. 2 ** 1024 overflows a float.
+    max_exponent = 64
 
-    # this is the Recommender class, allowing to store product purchased and retrieve product suggestion for a given product or products.
+    def __init__(self, max_partners=None, backend=None):
+        # number of co-purchased partners kept per product.
+        if max_partners is None:
+            max_partners = settings.RECOMMENDER_MAX_PARTNERS
+        self.max_partners = max_partners
+        # number of products kept per bestseller list.
+        self.max_bestsellers = settings.RECOMMENDER_MAX_BESTSELLERS
+        # number of suggestions precomputed per product.
+        self.max_suggestions = settings.RECOMMENDER_PRECOMPUTED_RESULTS
+        self.backend = backend or get_backend()
+        # half-life of co-purchase scores in seconds, 0 disables decay.
+        self.half_life = settings.RECOMMENDER_DECAY_HALF_LIFE * 86400
+        if self.half_life and (
+            settings.RECOMMENDER_DECAY_REBASE
+            + settings.RECOMMENDER_DECAY_INTERVAL / self.half_life
+            >= self.max_exponent
+        ):
+            raise ImproperlyConfigured(
+                'RECOMMENDER_DECAY_HALF_LIFE is too short for weights to '
+                'stay bounded between rebases.'
+            )
 
-    def suggest_products_for(self, products, max_results=6):
-        product_ids = [p.id for p in products]
-        if len(products) == 1:
-            # only 1 product
-            suggestions = r.zrange(
-                self.get_product_key(product_ids[0]), 0, -1 , desc=True
-            )[:max_results]
-
-        else:
-            # generate a temporary  Key  
-            flat_ids = ''.join([str(id) for id in product_ids])
-            tmp_key = f'tmp_{flat_ids}'
-            # multiple products, combine scores of all products.
-            # store the resulting sorted set in a temporary key
-            keys = [self.get_product_key(id) for id in product_ids]
-            r.zunionstore(tmp_key, keys)
-            # remove ids for the products the recommendation is for,
-            r.zrem(tmp_key, *product_ids)
-            # get the product ids by thier score , descendat sort
-            suggestions = r.zrange(
-                tmp_key, 0, -1, desc=True
-            )[:max_results]
-
-            # remove the temporary key.
-            r.delete(tmp_key)
-            suggested_products_ids = [int(id) for id in suggestions]
-            # get suggested products and sort by order of appearance.
-        suggested_products = list(
-            Product.objects.filter(id__in=suggested_products_ids)
-        )    
-        suggested_products.sort(
-            key=lambda x: suggested_products_ids.index(x.id)
+    def get_default_epoch(self, timestamp=None):
+        """
+        Return RECOMMENDER_DECAY_EPOCH moved forward by whole half-lives
+        up to timestamp, the epoch stored by the first decayed purchase.
+        """
+        epoch = settings.RECOMMENDER_DECAY_EPOCH
+        if not self.half_life:
+            return epoch
+        if timestamp is None:
+            timestamp = time.time()
+        shift = math.floor((timestamp - epoch) / self.half_life)
+        return epoch + max(shift, 0) * self.half_life
+
+    def get_epoch(self):
+        """
+        Return the decay epoch, moved forward by rebase_purchases().
+        """
+        return self.backend.get_epoch(self.get_default_epoch())
+
+    def get_weight(self, timestamp=None, epoch=None):
+        """
+        Return the score increment of a purchase made at timestamp.
+        With time decay enabled increments double every half-life, so
+        older purchases weigh less without rewriting stored scores.
+        rebase_purchases() keeps the increments bounded.
+        """
+        if not self.half_life:
+            return 1
+        if timestamp is None:
+            timestamp = time.time()
+        if epoch is None:
+            epoch = self.get_epoch()
+        return decay_weight(timestamp, epoch, self.half_life)
+
+    def rebase_purchases(self, timestamp=None, epoch=None, min_shift=1):
+        """
+        Move the decay epoch forward by whole half-lives up to timestamp,
+        if at least min_shift, and scale stored scores down to match.
+        Returns the current epoch.
+        """
+        if epoch is None:
+            epoch = self.get_epoch()
+        if timestamp is None:
+            timestamp = time.time()
+        shift = math.floor((timestamp - epoch) / self.half_life)
+        if shift < max(min_shift, 1):
+            return epoch
+        epoch += shift * self.half_life
+        # scores decayed past the float range become 0 and are purged.
+        self.backend.rebase(epoch, 2.0 ** -shift)
+        return epoch
+
+    def get_product_ids(self, products):
+        # accept Product instances or raw product ids, dropping duplicates.
+        return list(dict.fromkeys(getattr(p, 'id', p) for p in products))
+
+    def get_categories(self, products):
+        # category of each Product instance, raw ids have none.
+        return {
+            p.id: p.category_id for p in products if hasattr(p, 'category_id')
+        }
+
+    def products_bought(self, products, categories=None):
+        """
+        Store the products bought together in a single order.
+        """
+        self.orders_bought([products], categories=categories)
+
+    def orders_bought(self, orders, timestamp=None, categories=None):
+        """
+        Store the products bought together for a batch of orders, and
+        count their sales in the global and per-category bestsellers.
+        categories is an optional {product_id: category_id} mapping for
+        products passed as ids.
+        The Redis backend sends all pairwise increments in one round trip,
+        weighted against the decay epoch read in the same script.
+        Sets and bestseller lists are capped at RECOMMENDER_TRIM_HEADROOM
+        times their size, so a new product is not evicted from a full
+        list on its first purchase, trim_purchases() trims them back.
+        """
+        orders = [list(products) for products in orders]
+        categories = dict(categories or {})
+        for products in orders:
+            categories.update(self.get_categories(products))
+        self.backend.add_purchases(
+            [self.get_product_ids(products) for products in orders],
+            self.max_partners * settings.RECOMMENDER_TRIM_HEADROOM,
+            categories,
+            self.max_bestsellers * settings.RECOMMENDER_TRIM_HEADROOM,
+            half_life=self.half_life,
+            timestamp=timestamp,
+            default_epoch=self.get_default_epoch(timestamp)
         )
-        return suggested_products
 
+    def trim_purchases(self):
+        """
+        Trim every co-purchase set to max_partners members and every
+        bestseller list to max_bestsellers products.
+        Returns the number of keys visited.
+        """
+        return self.backend.trim_purchases(
+            self.max_partners, self.max_bestsellers
+        )
 
-    def clear_purchases(self):
-        for id in Product.objects.values_list('id', flat=True):
-            r.delete(self.get_product_key(id))
-            
-            # this is the method for clearing the recommendations.
-            
+    def purge_purchases(self):
+        """
+        Remove partners whose decayed score fell below
+        RECOMMENDER_DECAY_THRESHOLD.
+        Returns the number of keys visited.
+        """
+        min_score = settings.RECOMMENDER_DECAY_THRESHOLD * self.get_weight()
+        return self.backend.purge_purchases(min_score)
+
+    def load_purchases(self, partners):
+        """
+        Replace the co-purchase sets of the given products.
+        partners is an iterable of (product_id, {with_id: score}) pairs.
+        Returns the number of products loaded.
+        """
+        return self.backend.load_purchases(partners, self.max_partners)
+
+    def load_bestsellers(self, bestsellers):
+        """
+        Replace bestseller lists from a {category_id: {product_id: score}}
+        mapping, where the None category holds the global list.
+        """
+        self.backend.load_bestsellers(bestsellers, self.max_bestsellers)
+
+    def refresh_suggestions(self, batch_size=500):
+        """
+        Rebuild the precomputed suggestions of products whose
+        co-purchase sets changed since the last run.
+        Returns the number of products refreshed.
+        """
+        count = 0
+        while True:
+            product_ids = self.backend.get_changed(batch_size)
+            if not product_ids:
+                break
+            self.backend.store_suggestions(product_ids, self.max_suggestions)
+            count += len(product_ids)
+        return count
+
+    # this is the Recommender class, allowing to store product purchased and retrieve product suggestion for a given product or products.
+
+    def suggest_product_ids_for(self, products, max_results=6):
+        products = list(products)
+        product_ids = self.get_product_ids(products)
+        if not product_ids:
+            return []
+        # a single product uses the precomputed suggestions if available,
+        # multiple products combine the scores of all products.
+        suggestions, bestsellers = self.backend.suggest(
+            product_ids,
+            max_results,
+            list(dict.fromkeys(self.get_categories(products).values())),
+            max_bestsellers=2 * max_results + len(product_ids),
+            precomputed=max_results <= self.max_suggestions
+        )
+        # fill the remaining slots with category and global bestsellers.
+        seen = set(product_ids).union(suggestions)
+        for ids in bestsellers:
+            for id in ids:
+                if len(suggestions) >= max_results:
+                    return suggestions
+                if id not in seen:
+                    suggestions.append(id)
+                    seen.add(id)
+        return suggestions
+
+    def suggest_products_for(self, products, max_results=6):
+        """
+        Return product cards for the suggested products,
+        in order of appearance.
+        """
+        suggested_products_ids = self.suggest_product_ids_for(
+            products, max_results
+        )
+        return get_product_cards(suggested_products_ids)
 
 
+    def clear_purchases(self, progress=None):
+        """
+        Remove all recommendation data without querying the catalog.
+        Returns the number of items removed.
+        """
+        # this is the method for clearing the recommendations.
+        return self.backend.clear(progress)
@@ -0,0 +1,18 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .cards import invalidate_product_cards
+from .models import Product
+
+ProductTranslation = Product._parler_meta.root_model
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance, **kwargs):
+    invalidate_product_cards([instance.id])
+
+
+@receiver(post_save, sender=ProductTranslation)
+@receiver(post_delete, sender=ProductTranslation)
+def product_translation_changed(sender, instance, **kwargs):
+    invalidate_product_cards([instance.master_id])
@@ -0,0 +1,63 @@
+from celery import shared_task
+from django.conf import settings
+from .recommender import Recommender
+
+
+@shared_task(
+    autoretry_for=(Exception,),
+    retry_backoff=True,
+    max_retries=5
+)
+def products_bought(items):
+    """
+    Task to store the products bought together in a paid order, given
+    as (product_id, category_id) pairs.
+    """
+    items = dict(items)
+    r = Recommender()
+    r.products_bought(items, categories=items)
+
+
+@shared_task
+def refresh_recommendations():
+    """
+    Task to rebuild the precomputed suggestions of products
+    whose co-purchase sets changed since the last run.
+    """
+    r = Recommender()
+    return r.refresh_suggestions()
+
+
+@shared_task(bind=True)
+def clear_recommendations(self):
+    """
+    Task to remove all recommendation data, reporting progress
+    in the task state.
+    """
+    def progress(removed):
+        self.update_state(state='PROGRESS', meta={'removed': removed})
+
+    r = Recommender()
+    return r.clear_purchases(progress)
+
+
+@shared_task
+def purge_recommendations():
+    """
+    Task to rebase decayed scores once they grew past
+    RECOMMENDER_DECAY_REBASE half-lives, and remove co-purchase
+    partners whose decayed score fell below the purge threshold.
+    """
+    r = Recommender()
+    r.rebase_purchases(min_shift=settings.RECOMMENDER_DECAY_REBASE)
+    return r.purge_purchases()
+
+
+@shared_task
+def trim_recommendations():
+    """
+    Task to trim co-purchase sets and bestseller lists grown during
+    ingestion back to their configured size.
+    """
+    r = Recommender()
+    return r.trim_purchases()
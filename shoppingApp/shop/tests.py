@@ -1,3 +1,206 @@
-from django.test import TestCase
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+from django.test import SimpleTestCase, override_settings
+from .backends import MemoryBackend, RedisBackend
+from .recommender import Recommender
 
-# Create your tests here.
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+DAY = 86400
+
+
+def make_redis_backend():
+    # a backend on its own in-memory server.
+    server = fakeredis.FakeServer()
+    with mock.patch(
+        'shop.backends.redis.Redis',
+        lambda **kwargs: fakeredis.FakeRedis(server=server)
+    ):
+        return RedisBackend()
+
+
+@override_settings(
+    RECOMMENDER_DECAY_HALF_LIFE=0,
+    RECOMMENDER_MAX_BESTSELLERS=3,
+    RECOMMENDER_PRECOMPUTED_RESULTS=3,
+    RECOMMENDER_TRIM_HEADROOM=2,
+    RECOMMENDER_UNION_TTL=60,
+)
+class MemoryRecommenderTests(SimpleTestCase):
+
+    def setUp(self):
+        self.backend = MemoryBackend()
+        self.r = Recommender(max_partners=2, backend=self.backend)
+
+    def test_ingestion(self):
+        self.r.orders_bought([[1, 2, 3], [1, 2]])
+        self.r.products_bought([1, 3, 3])
+        self.assertEqual(self.backend.purchases[1], {2: 2, 3: 2})
+        self.assertEqual(self.backend.purchases[3], {1: 2, 2: 1})
+        self.assertEqual(self.backend.bestsellers[None], {1: 3, 2: 2, 3: 2})
+        self.assertEqual(self.backend.changed, {1, 2, 3})
+
+    def test_ingestion_counts_category_bestsellers(self):
+        self.r.orders_bought([[1, 2]], categories={1: 10, 2: 20})
+        self.assertEqual(self.backend.bestsellers[10], {1: 1})
+        self.assertEqual(self.backend.bestsellers[20], {2: 1})
+
+    def test_ingestion_keeps_headroom_for_new_partners(self):
+        for _ in range(5):
+            self.r.products_bought([1, 2, 3])
+        for _ in range(6):
+            self.r.products_bought([1, 4])
+        # ingestion trims to twice max_partners, 4 was not evicted.
+        self.assertEqual(self.r.suggest_product_ids_for([1], 2), [4, 3])
+
+    def test_trimming(self):
+        for products in [[1, 2], [1, 2], [1, 3], [1, 4], [1, 4], [1, 4]]:
+            self.r.products_bought(products)
+        self.assertEqual(len(self.backend.purchases[1]), 3)
+        self.r.trim_purchases()
+        self.assertEqual(self.backend.purchases[1], {4: 3, 2: 2})
+        self.assertEqual(len(self.backend.bestsellers[None]), 3)
+
+    def test_precomputed_suggestions(self):
+        self.r.orders_bought([[1, 2], [1, 2], [1, 3]])
+        self.assertEqual(self.r.refresh_suggestions(), 3)
+        self.assertEqual(self.backend.suggestions[1], [2, 3])
+        # stale precomputed suggestions are read until the next refresh.
+        self.r.orders_bought([[1, 3], [1, 3]])
+        self.assertEqual(self.r.suggest_product_ids_for([1], 1), [2])
+        self.r.refresh_suggestions()
+        self.assertEqual(self.r.suggest_product_ids_for([1], 1), [3])
+
+    def test_failed_refresh_keeps_changed_products(self):
+        self.r.orders_bought([[1, 2]])
+        with mock.patch.object(
+            self.backend, 'top_partners', side_effect=RuntimeError
+        ), self.assertRaises(RuntimeError):
+            self.r.refresh_suggestions()
+        self.assertEqual(self.backend.changed, {1, 2})
+        self.assertEqual(self.r.refresh_suggestions(), 2)
+        self.assertEqual(self.backend.changed, set())
+
+    def test_union_caching(self):
+        self.r.orders_bought([[1, 3], [2, 3], [2, 4]])
+        with mock.patch('shop.backends.time.monotonic', return_value=100):
+            self.assertEqual(
+                self.r.suggest_product_ids_for([1, 2], 2), [3, 4]
+            )
+            self.r.orders_bought([[1, 4], [2, 4]])
+            # the union of the same products is served from the cache.
+            self.assertEqual(
+                self.r.suggest_product_ids_for([2, 1], 2), [3, 4]
+            )
+        with mock.patch('shop.backends.time.monotonic', return_value=161):
+            self.assertEqual(
+                self.r.suggest_product_ids_for([1, 2], 2), [4, 3]
+            )
+
+    def test_union_excludes_given_products(self):
+        self.r.orders_bought([[1, 2, 3]])
+        self.assertEqual(self.r.suggest_product_ids_for([1, 2], 3), [3])
+
+    def test_bestseller_fill(self):
+        categories = {1: 10, 2: 10, 3: 10, 5: 20, 6: 20}
+        self.r.orders_bought(
+            [[1, 2], [3], [3], [5], [5], [5], [6]], categories=categories
+        )
+        product = SimpleNamespace(id=1, category_id=10)
+        # the single partner is followed by category, then global sellers.
+        self.assertEqual(
+            self.r.suggest_product_ids_for([product], 4), [2, 3, 5, 6]
+        )
+
+    def test_no_products(self):
+        self.assertEqual(self.r.suggest_product_ids_for([], 3), [])
+
+
+@override_settings(
+    RECOMMENDER_DECAY_EPOCH=0,
+    RECOMMENDER_DECAY_HALF_LIFE=1,
+    RECOMMENDER_MAX_BESTSELLERS=0,
+)
+class MemoryDecayTests(SimpleTestCase):
+
+    def setUp(self):
+        self.backend = self.make_backend()
+        self.r = Recommender(max_partners=0, backend=self.backend)
+
+    def make_backend(self):
+        return MemoryBackend()
+
+    def get_score(self, product_id, with_id):
+        return self.backend.purchases[product_id][with_id]
+
+    def test_first_purchase_stores_epoch(self):
+        # 1000 half-lives past the configured epoch.
+        timestamp = 1000.25 * DAY
+        with mock.patch.object(
+            type(self.backend), 'rebase', side_effect=AssertionError
+        ):
+            self.r.orders_bought([[1, 2]], timestamp=timestamp)
+        self.assertEqual(self.backend.get_epoch(None), 1000 * DAY)
+        self.assertAlmostEqual(self.get_score(1, 2), 2 ** 0.25)
+
+    def test_ingestion_uses_rebased_epoch(self):
+        self.r.orders_bought([[1, 2]], timestamp=0)
+        self.r.orders_bought([[1, 3]], timestamp=DAY)
+        self.r.rebase_purchases(timestamp=DAY)
+        self.assertEqual(self.backend.get_epoch(None), DAY)
+        self.r.orders_bought([[1, 2]], timestamp=DAY)
+        self.assertAlmostEqual(self.get_score(1, 2), 1.5)
+        self.assertAlmostEqual(self.get_score(1, 3), 1)
+
+
+@skipUnless(fakeredis, 'fakeredis is not installed')
+class RedisDecayTests(MemoryDecayTests):
+
+    def make_backend(self):
+        return make_redis_backend()
+
+    def get_score(self, product_id, with_id):
+        return self.backend.r.zscore(
+            self.backend.get_product_key(product_id), with_id
+        )
+
+    def test_ingestion_is_one_round_trip(self):
+        # the first call also loads the script.
+        self.r.orders_bought([[1, 2]], timestamp=0)
+        with mock.patch.object(
+            self.backend.r, 'execute_command',
+            wraps=self.backend.r.execute_command
+        ) as execute:
+            self.r.orders_bought([[1, 2, 3], [2, 4]], timestamp=DAY)
+        self.assertEqual(execute.call_count, 1)
+
+
+@skipUnless(fakeredis, 'fakeredis is not installed')
+@override_settings(RECOMMENDER_PRECOMPUTED_RESULTS=2)
+class RedisRefreshTests(SimpleTestCase):
+
+    def setUp(self):
+        self.backend = make_redis_backend()
+        self.r = Recommender(max_partners=0, backend=self.backend)
+
+    def test_refresh_stores_suggestions_and_clears_changed(self):
+        self.r.orders_bought([[1, 2], [1, 2], [1, 3], [1, 4]])
+        self.assertEqual(self.r.refresh_suggestions(batch_size=2), 4)
+        self.assertEqual(self.backend.get_changed(10), [])
+        self.assertEqual(
+            self.backend.r.hget(self.backend.suggestions_key, 1), b'2,4'
+        )
+        self.assertEqual(self.r.suggest_product_ids_for([1], 2), [2, 4])
+
+    def test_failed_refresh_keeps_changed_products(self):
+        self.r.orders_bought([[1, 2]])
+        with mock.patch.object(
+            self.backend, 'store_suggestions_script',
+            side_effect=ConnectionError
+        ), self.assertRaises(ConnectionError):
+            self.r.refresh_suggestions()
+        self.assertEqual(sorted(self.backend.get_changed(10)), [1, 2])
+        self.assertEqual(self.r.refresh_suggestions(), 2)